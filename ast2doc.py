@@ -1,18 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from glob import glob
 from os import path
 import sys, os, json
 from re import match
+from itertools import izip
 import utils
+from export_sqlite import export_api
+from symbol_index import symbol_users
 from landing_page import print_landingPage, print_disambiguationPage, encode_package_name
 from render import printout, render_module, render_external, missing_description, jquery_url, jquery_function
 
 #=============================================================================
 def main():
     if(len(sys.argv) != 4):
-        print("Usage: ast2doc.py <src-dir> <ASTs-dir> <HTML-output-dir>")
+        print("Usage: ast2doc.py <src-dir> <ASTs-dir|ASTs-bundle> <HTML-output-dir>")
         sys.exit(1)
 
     src_dir = sys.argv[1]
@@ -22,9 +24,18 @@ def main():
     # pre compute the lookup table of imported symbols
     sym_lookup_table = lookup_imported_symbols(ast_dir)
 
+    # export the API model for ad-hoc queries, if asked for
+    sqlite_export = os.getenv('AST2DOC_SQLITE_EXPORT')
+    if sqlite_export:
+        export_api(ast_dir, sym_lookup_table, sqlite_export)
+
     # dump modules and own publics lists in JSON
     symbols_db = dump_modules_publics(sym_lookup_table, out_dir)
 
+    # who uses what, for the module pages, and its JSON shards
+    users = symbol_users(sym_lookup_table)
+    dump_used_by(users, sym_lookup_table, out_dir)
+
     # build a packages tree
     packages = scan_packages(src_dir)
     src_tree = build_tree(packages)
@@ -37,7 +48,11 @@ def main():
                                         packages=packages,
                                         ast_dir=ast_dir,
                                         output_dir=out_dir,
-                                        sym_lookup_table=sym_lookup_table)
+                                        sym_lookup_table=sym_lookup_table,
+                                        users=users)
+
+    # the ASTs are not needed anymore
+    utils.ast_store.clear()
 
     # dump private referenced symbols in JSON
     dump_privates_referenced(privates_referenced, out_dir)
@@ -53,23 +68,43 @@ def main():
                       modules_description=modules_description,
                       sym_lookup_table=sym_lookup_table)
 
+    # the lookup table is not needed anymore either
+    utils.close_symbol_table(sym_lookup_table)
+
     # Disambiguation page
     print_disambiguationPage(symbols_db, modules_description, out_dir)
 
+    # parsed-AST cache & store effectiveness
+    utils.print_ast_cache_stats()
+    utils.ast_store.print_stats()
+    utils.print_forward_chains_stats()
+    utils.print_symbol_table_stats(sym_lookup_table)
+    utils.print_peak_rss()
+
 #=============================================================================
 def lookup_imported_symbols(ast_dir):
 
-    sym_lookup_table = {}
+    # what is still valid from the previous run
+    ast_files = utils.list_ast_files(ast_dir)
+    sym_lookup_table, records = utils.load_symbol_table(ast_dir, ast_files)
+    reused = len(sym_lookup_table)
 
-    for f in glob(path.join(ast_dir, "*.ast")):
+    todo = [f for f in ast_files if not f in records]
+    for f in todo:
         print("Reading for cache: " + f)
-        ast = utils.read_ast(f, do_doxycheck=False)
-        utils.cache_symbol_lookup(ast, ast_dir, sym_lookup_table)
+        records[f] = utils.symbol_table_record(f, utils.ast_store.get(f))
+    nlevels, npooled = utils.resolve_symbols(todo, ast_dir, sym_lookup_table, jobs=utils.resolve_jobs)
+
+    # saved before the rendering, which marks the referenced private symbols in the maps
+    utils.save_symbol_table(ast_dir, sym_lookup_table, records)
+    pooled = ' (%d of them by %d processes)' % (npooled, utils.resolve_jobs) if npooled else ''
+    print 'Symbol lookup table: %d entries reused, %d recomputed in %d dependency levels%s' % (
+        reused, len(sym_lookup_table) - reused, nlevels, pooled)
 
     return(sym_lookup_table)
 
 #=============================================================================
-def document_all_modules(packages, ast_dir, output_dir, sym_lookup_table):
+def document_all_modules(packages, ast_dir, output_dir, sym_lookup_table, users):
 
     # init
     modules_lists = {'__ALL__':[]}
@@ -78,6 +113,7 @@ def document_all_modules(packages, ast_dir, output_dir, sym_lookup_table):
 
     # scan packages
     src_root = path.normpath(path.commonprefix(packages.keys()))
+    todo = []
     for d, p in packages.iteritems():
         # d: dir hosting a PACKAGE file, p: basically the eval()uation of that PACKAGE file
         rel_path = path.relpath(d, src_root)
@@ -86,37 +122,43 @@ def document_all_modules(packages, ast_dir, output_dir, sym_lookup_table):
         # scan PACKAGE-owned module files (the 'files' key is contributed by the scan_packages() function)
         for f in p['files']:
             mod_name = f.rsplit(".", 1)[0]
-            ast_file = path.join(ast_dir, mod_name + ".ast")
-            if(path.isfile(ast_file)):
-                print("Reading ast: "+ast_file)
-                ast = utils.read_ast(ast_file)
-                if(ast['tag'] == 'module'):
-                    if(utils.verbose()): print '>>>> Module: %s [%s]' % (mod_name, rel_path)
-
-                    # lists of modules per PACKAGE, needed by the landing page
-                    modules_lists[rel_path].append(mod_name)
-                    modules_lists['__ALL__'].append(mod_name)
-                    modules_description[mod_name] = ast['descr'][0] if ast['descr'] else missing_description # Only 1st \brief is retained here
-
-                    # dump the current module HTML documentation
-                    body, my_privates_referenced = render_module(ast, rel_path, ast_dir, output_dir, sym_lookup_table)
-                    printout(body, output_dir, mod_name=mod_name,
-                        jscript=['packages_modules.json', 'js/common.js', 'js/updateURL.js', 'js/highlightArgument.js', jquery_url],
-                        custom_script=jquery_function%mod_name)
-                    if my_privates_referenced:
-                        privates_referenced[mod_name.upper()] = my_privates_referenced
-
+            ast_file = utils.module_ast_file(ast_dir, mod_name)
+            if(utils.ast_file_exists(ast_file)):
+                todo.append((rel_path, mod_name, ast_file))
+
+    # the next ASTs are read while the current module gets rendered
+    prefetcher = utils.ASTPrefetcher(utils.ast_store, [ast_file for r, m, ast_file in todo], utils.prefetch_depth)
+    for (rel_path, mod_name, ast_file), (f, ast) in izip(todo, prefetcher):
+        print("Reading ast: "+ast_file)
+        if(ast['tag'] == 'module'):
+            if(utils.verbose()): print '>>>> Module: %s [%s]' % (mod_name, rel_path)
+
+            # lists of modules per PACKAGE, needed by the landing page
+            modules_lists[rel_path].append(mod_name)
+            modules_lists['__ALL__'].append(mod_name)
+            modules_description[mod_name] = ast['descr'][0] if ast['descr'] else missing_description # Only 1st \brief is retained here
+
+            # dump the current module HTML documentation
+            body, my_privates_referenced = render_module(ast, rel_path, ast_dir, output_dir, sym_lookup_table, users)
+            printout(body, output_dir, mod_name=mod_name,
+                jscript=['packages_modules.json', 'js/common.js', 'js/updateURL.js', 'js/highlightArgument.js', jquery_url],
+                custom_script=jquery_function%mod_name)
+            if my_privates_referenced:
+                privates_referenced[mod_name.upper()] = my_privates_referenced
+
+    prefetcher.print_stats()
     return modules_lists, modules_description, privates_referenced
 
 #=============================================================================
 def dump_modules_publics(sym_lookup_table, out_dir):
 
     # modules DB
-    mdump = json.dumps(sym_lookup_table.keys(), sort_keys=True).lower()
+    mdump = json.dumps(sorted(sym_lookup_table)).lower()
 
     # symbols DB
     syms = {}
-    dummy = [syms.setdefault(s, []).append(m) for m in sym_lookup_table for s in sym_lookup_table[m]['my_symbols']]
+    # in the order of the names, whatever the backend of the table
+    dummy = [syms.setdefault(s, []).append(m) for m in sorted(sym_lookup_table) for s in sym_lookup_table[m]['my_symbols']]
     sdump = json.dumps(syms).lower()
 
     f = open(path.join(out_dir, 'modules_publics.json'), 'w')
@@ -126,6 +168,29 @@ def dump_modules_publics(sym_lookup_table, out_dir):
 
     return syms
 
+#=============================================================================
+def dump_used_by(users, sym_lookup_table, out_dir):
+    """ One file per module, mapping its public symbols to the modules using them."""
+
+    by_module = {}
+    for (mod, sym), mods in users.iteritems():
+        by_module.setdefault(mod, {})[sym] = mods
+    shards = {}
+    for mod, syms in by_module.iteritems():
+        if mod in sym_lookup_table: # external modules excluded
+            my_symbols = set(sym_lookup_table[mod]['my_symbols'])
+            mine = dict( (sym, mods) for sym, mods in syms.iteritems() if sym in my_symbols )
+            if mine:
+                shards[mod] = mine
+
+    shards_dir = path.join(out_dir, 'used_by')
+    if not path.isdir(shards_dir):
+        os.makedirs(shards_dir)
+    for mod, syms in shards.iteritems():
+        f = open(path.join(shards_dir, mod.lower() + '.json'), 'w')
+        f.write("used_by = '" + json.dumps(syms, sort_keys=True).lower() + "'\n")
+        f.close()
+
 #=============================================================================
 def dump_privates_referenced(privates_referenced, out_dir):
     syms = {}
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compare the description sanitizer against the former one-parser-per-line path.
+# Usage: bench_html_checker.py <ASTs-dir> [repetitions, default 3]
+
+import sys, os, time
+from glob import glob
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import utils
+
+#=============================================================================
+def collect_lines(o, lines):
+    if isinstance(o, dict):
+        descr = o.get('descr')
+        if descr:
+            lines.extend(descr if isinstance(descr, list) else [descr])
+        for v in o.itervalues():
+            collect_lines(v, lines)
+    elif isinstance(o, (list, tuple)):
+        for v in o:
+            collect_lines(v, lines)
+
+#=============================================================================
+def former_checker(lines):
+    return [utils.parse_html_line(l) for l in lines]
+
+#=============================================================================
+def fast_checker(lines):
+    utils.html_checked.clear() # start cold, every time
+    return [utils.html_checker(l) for l in lines]
+
+#=============================================================================
+def best_of(func, arg, repeat):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        result = func(arg)
+        elapsed = time.time() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+#=============================================================================
+def main():
+    if(len(sys.argv) not in (2, 3)):
+        print("Usage: bench_html_checker.py <ASTs-dir> [repetitions]")
+        sys.exit(1)
+
+    ast_dir = sys.argv[1]
+    repeat = int(sys.argv[2]) if len(sys.argv) == 3 else 3
+
+    lines = []
+    for fn in sorted(glob(os.path.join(ast_dir, "*.ast"))):
+        collect_lines(utils.parse_ast_text(open(fn).read()), lines)
+    markup = sum(1 for l in lines if '&' in l or '<' in l)
+
+    t_former, out_former = best_of(former_checker, lines, repeat)
+    t_fast, out_fast = best_of(fast_checker, lines, repeat)
+    assert(out_fast == out_former)
+
+    print '%d description lines (%d distinct), %d with markup characters' % (len(lines), len(set(lines)), markup)
+    print '%-10s %10s' % ('checker', 'time [s]')
+    print '%-10s %10.4f' % ('former', t_former)
+    print '%-10s %10.4f' % ('fast', t_fast)
+    print 'speedup: %.1f' % (t_former/t_fast if t_fast else float('inf'))
+
+#=============================================================================
+if __name__ == '__main__':
+    main()
+
+#EOF
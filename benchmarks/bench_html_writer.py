@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compare the streaming page writer against the former make() + join path, in
+# time and peak memory, on the largest module pages. Linux only (fork, ru_maxrss).
+# Usage: bench_html_writer.py <ASTs-dir> [number of largest modules, default 5]
+
+import sys, os, time, shutil, tempfile, resource
+import cPickle as pickle
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import utils, render
+from makeHTML import newTag
+from ast2doc import lookup_imported_symbols
+from symbol_index import symbol_users
+
+#=============================================================================
+def former_writer(html, f):
+    f.write('\n'.join(["<!DOCTYPE html>", html.make(tab='  ')]))
+
+#=============================================================================
+def streaming_writer(html, f):
+    render.write_page(html, f)
+
+#=============================================================================
+def measure(writer, html, out_file):
+    """ Time and peak memory growth [kB] of writing the page, in a forked process
+        so that each writer starts from the same memory state."""
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t0 = time.time()
+        f = open(out_file, 'w')
+        writer(html, f)
+        f.close()
+        elapsed = time.time() - t0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0
+        os.write(w, pickle.dumps((elapsed, peak)))
+        os._exit(0)
+    os.close(w)
+    result = ''
+    while True:
+        chunk = os.read(r, 4096)
+        if not chunk:
+            break
+        result += chunk
+    os.close(r)
+    os.waitpid(pid, 0)
+    return pickle.loads(result)
+
+#=============================================================================
+def main():
+    if(len(sys.argv) not in (2, 3)):
+        print("Usage: bench_html_writer.py <ASTs-dir> [number of largest modules]")
+        sys.exit(1)
+
+    ast_dir = sys.argv[1]
+    nfiles = int(sys.argv[2]) if len(sys.argv) == 3 else 5
+
+    sym_lookup_table = lookup_imported_symbols(ast_dir)
+    users = symbol_users(sym_lookup_table)
+    files = sorted(utils.list_ast_files(ast_dir), key=os.path.getsize, reverse=True)[:nfiles]
+
+    tmp_dir = tempfile.mkdtemp()
+    print '%-30s %10s %10s %10s %12s %12s' % ('module', 'page [kB]', 'make [s]', 'write [s]', 'make [MB]', 'write [MB]')
+    try:
+        for fn in files:
+            ast = utils.ast_store.get(fn)
+            if ast['tag'] != 'module':
+                continue
+            body, privates = render.render_module(ast, '.', ast_dir, tmp_dir, sym_lookup_table, users)
+            html = newTag('html', content=[newTag('head'), body])
+
+            former_file, streaming_file = os.path.join(tmp_dir, 'former.html'), os.path.join(tmp_dir, 'streaming.html')
+            t_former, m_former = measure(former_writer, html, former_file)
+            t_streaming, m_streaming = measure(streaming_writer, html, streaming_file)
+            assert(open(former_file).read() == open(streaming_file).read())
+
+            print '%-30s %10d %10.4f %10.4f %12.1f %12.1f' % (ast['lname'], os.path.getsize(former_file)/1024,
+                t_former, t_streaming, m_former/1024.0, m_streaming/1024.0)
+    finally:
+        shutil.rmtree(tmp_dir)
+        utils.close_symbol_table(sym_lookup_table)
+
+#=============================================================================
+if __name__ == '__main__':
+    main()
+
+#EOF
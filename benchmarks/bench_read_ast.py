@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compare the literal-only AST loader against the former eval() path.
+# Usage: bench_read_ast.py <ASTs-dir> [number of largest files, default 10]
+
+import sys, os, time
+from glob import glob
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import utils
+
+#=============================================================================
+def best_of(func, arg, repeat=3):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        result = func(arg)
+        elapsed = time.time() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+#=============================================================================
+def main():
+    if(len(sys.argv) not in (2, 3)):
+        print("Usage: bench_read_ast.py <ASTs-dir> [number of largest files]")
+        sys.exit(1)
+
+    ast_dir = sys.argv[1]
+    nfiles = int(sys.argv[2]) if len(sys.argv) == 3 else 10
+
+    files = sorted(glob(os.path.join(ast_dir, "*.ast")), key=os.path.getsize, reverse=True)[:nfiles]
+
+    tot_eval, tot_fast = 0.0, 0.0
+    print '%-40s %10s %10s %10s %8s' % ('file', 'size [kB]', 'eval [s]', 'fast [s]', 'speedup')
+    for fn in files:
+        content = open(fn).read()
+        t_eval, ast_eval = best_of(eval, content)
+        t_fast, ast_fast = best_of(utils.parse_ast_text, content)
+        assert(ast_fast == ast_eval)
+        tot_eval += t_eval
+        tot_fast += t_fast
+        print '%-40s %10d %10.4f %10.4f %8.2f' % (os.path.basename(fn), len(content)/1024, t_eval, t_fast, t_eval/t_fast)
+
+    if files:
+        print '%-40s %10s %10.4f %10.4f %8.2f' % ('TOTAL', '', tot_eval, tot_fast, tot_eval/tot_fast)
+
+#=============================================================================
+if __name__ == '__main__':
+    main()
+
+#EOF
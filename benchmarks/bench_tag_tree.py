@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Size of the tag trees of the largest module pages (see makeHTML.tagStats).
+# Usage: bench_tag_tree.py <ASTs-dir> [number of largest modules, default 5]
+
+import sys, os, shutil, tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import utils, render
+from makeHTML import tagStats
+from ast2doc import lookup_imported_symbols
+from symbol_index import symbol_users
+
+#=============================================================================
+def main():
+    if(len(sys.argv) not in (2, 3)):
+        print("Usage: bench_tag_tree.py <ASTs-dir> [number of largest modules]")
+        sys.exit(1)
+
+    ast_dir = sys.argv[1]
+    nfiles = int(sys.argv[2]) if len(sys.argv) == 3 else 5
+
+    sym_lookup_table = lookup_imported_symbols(ast_dir)
+    users = symbol_users(sym_lookup_table)
+    files = sorted(utils.list_ast_files(ast_dir), key=os.path.getsize, reverse=True)[:nfiles]
+
+    tmp_dir = tempfile.mkdtemp()
+    print '%-30s %10s %10s %10s' % ('module', 'tags', 'tree [kB]', 'bytes/tag')
+    try:
+        for fn in files:
+            ast = utils.ast_store.get(fn)
+            if ast['tag'] != 'module':
+                continue
+            body, privates = render.render_module(ast, '.', ast_dir, tmp_dir, sym_lookup_table, users)
+            nodes, size = tagStats(body)
+            print '%-30s %10d %10d %10.1f' % (ast['lname'], nodes, size/1024, float(size)/nodes)
+    finally:
+        shutil.rmtree(tmp_dir)
+        utils.close_symbol_table(sym_lookup_table)
+
+#=============================================================================
+if __name__ == '__main__':
+    main()
+
+#EOF
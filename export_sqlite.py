@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Export the API model (modules, publics, routines and their arguments, types,
+# interfaces, USE edges and forward chains) into an indexed SQLite database, e.g.
+#   SELECT r.module, r.name FROM routines r JOIN arguments a ON a.routine = r.id
+#    WHERE a.type = 'TYPE(DBCSR_TYPE)' AND a.intent = 'INOUT';
+# Run by ast2doc.py when $AST2DOC_SQLITE_EXPORT names the database file.
+
+import sys, os, time
+from itertools import count
+import sqlite3
+import utils
+
+schema = [
+    'CREATE TABLE modules (name TEXT PRIMARY KEY, file TEXT, descr TEXT)',
+    # symbols imported from several modules have a row per candidate owner
+    'CREATE TABLE publics (module TEXT, symbol TEXT, category TEXT, owner_module TEXT, owner_symbol TEXT)',
+    # module procedures (interface is NULL) and procedures of abstract/explicit interfaces
+    'CREATE TABLE routines (id INTEGER PRIMARY KEY, module TEXT, name TEXT, kind TEXT, interface TEXT,'
+                          ' public INTEGER, attrs TEXT, retval_type TEXT, descr TEXT)',
+    'CREATE TABLE arguments (routine INTEGER, position INTEGER, name TEXT, type TEXT, intent TEXT,'
+                           ' dim TEXT, attrs TEXT, descr TEXT)',
+    'CREATE TABLE types (module TEXT, name TEXT, public INTEGER, descr TEXT)',
+    'CREATE TABLE type_components (module TEXT, type TEXT, position INTEGER, name TEXT, ctype TEXT,'
+                                 ' dim TEXT, attrs TEXT, init TEXT, descr TEXT)',
+    'CREATE TABLE interfaces (module TEXT, name TEXT, task TEXT, public INTEGER, descr TEXT)',
+    'CREATE TABLE interface_procedures (module TEXT, interface TEXT, position INTEGER, procedure TEXT)',
+    # symbol and remote_symbol are NULL for a USE without ONLY
+    'CREATE TABLE uses (module TEXT, used_module TEXT, symbol TEXT, remote_symbol TEXT)',
+    'CREATE TABLE forward_chains (module TEXT, symbol TEXT, step INTEGER, step_module TEXT, step_symbol TEXT)',
+]
+
+# created once the tables are loaded
+indices = [
+    'CREATE INDEX publics_symbol ON publics (symbol)',
+    'CREATE INDEX publics_owner ON publics (owner_module, owner_symbol)',
+    'CREATE INDEX routines_name ON routines (name)',
+    'CREATE INDEX routines_module ON routines (module)',
+    'CREATE INDEX arguments_routine ON arguments (routine)',
+    'CREATE INDEX arguments_type ON arguments (type, intent)',
+    'CREATE INDEX types_name ON types (name)',
+    'CREATE INDEX type_components_type ON type_components (module, type)',
+    'CREATE INDEX type_components_ctype ON type_components (ctype)',
+    'CREATE INDEX interfaces_name ON interfaces (name)',
+    'CREATE INDEX interface_procedures_procedure ON interface_procedures (procedure)',
+    'CREATE INDEX uses_module ON uses (module)',
+    'CREATE INDEX uses_used_module ON uses (used_module, symbol)',
+    'CREATE INDEX forward_chains_symbol ON forward_chains (module, symbol)',
+]
+
+batch_modules = 64 # modules per transaction
+
+#=============================================================================
+def main():
+    if(len(sys.argv) != 3):
+        print("Usage: export_sqlite.py <ASTs-dir|ASTs-bundle> <database-file>")
+        sys.exit(1)
+
+    ast_dir = sys.argv[1]
+    db_file = sys.argv[2]
+
+    from ast2doc import lookup_imported_symbols
+    sym_lookup_table = lookup_imported_symbols(ast_dir)
+    export_api(ast_dir, sym_lookup_table, db_file)
+    utils.close_symbol_table(sym_lookup_table)
+
+#=============================================================================
+def export_api(ast_dir, sym_lookup_table, db_file):
+    """ Write the database from scratch, aside first: an existing one is only
+        replaced once complete."""
+    t0 = time.time()
+    tmp_file = '%s.%d.tmp' % (db_file, os.getpid())
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    db = sqlite3.connect(tmp_file)
+    db.text_factory = str
+    db.execute('PRAGMA journal_mode=OFF') # a failed export leaves the temporary file only
+    db.execute('PRAGMA synchronous=OFF')
+    for statement in schema:
+        db.execute(statement)
+
+    rows = new_batch()
+    counts = dict.fromkeys(rows, 0)
+    ids = count(1)
+    nmodules = 0
+    for fn in utils.list_ast_files(ast_dir):
+        ast = utils.ast_store.get(fn)
+        if ast['tag'] != 'module' or not ast['name'] in sym_lookup_table:
+            continue
+        export_module(ast, os.path.basename(fn), sym_lookup_table, rows, ids)
+        nmodules += 1
+        if not nmodules % batch_modules:
+            flush(db, rows, counts)
+            rows = new_batch()
+    flush(db, rows, counts)
+
+    for statement in indices:
+        db.execute(statement)
+    db.commit()
+    db.close()
+    os.rename(tmp_file, db_file)
+
+    print 'SQLite export: %s (%s) in %.1f s' % (db_file,
+        ', '.join('%d %s' % (counts[t], t) for t in table_names()), time.time() - t0)
+
+#=============================================================================
+def table_names():
+    return [statement.split()[2] for statement in schema]
+
+#=============================================================================
+def new_batch():
+    return dict( (t, []) for t in table_names() )
+
+#=============================================================================
+def flush(db, rows, counts):
+    """ Insert a batch of rows, in one transaction."""
+    for t, t_rows in rows.iteritems():
+        if t_rows:
+            db.executemany('INSERT INTO %s VALUES (%s)' % (t, ', '.join(['?']*len(t_rows[0]))), t_rows)
+            counts[t] += len(t_rows)
+    db.commit()
+
+#=============================================================================
+def export_module(ast, file_name, sym_lookup_table, rows, ids):
+    mod_name = ast['name']
+    entry = sym_lookup_table[mod_name]
+    symmap, symcat = entry['symbols_map'], entry['symbols_cat']
+    publics = ast['__publics__']
+
+    rows['modules'].append( (mod_name, file_name, text(ast)) )
+
+    # publics, by their owner
+    for p in ast['publics']:
+        sym = p['name']
+        if not sym in symmap: # external symbols
+            continue
+        m, s = symmap[sym]
+        owners = s if m == '__MULTI__' else [(mod_name, s) if m == '__HERE__' else (m, s)]
+        for owner_module, owner_symbol in owners:
+            rows['publics'].append( (mod_name, sym, symcat.get(sym), owner_module, owner_symbol) )
+
+        # forwarded ones, the steps up to their original location
+        if not m in ('__HERE__', '__MULTI__') and not sym in utils.external_symbols:
+            for step, (step_module, step_symbol) in enumerate(utils.forward_chain(mod_name, sym, sym_lookup_table)):
+                rows['forward_chains'].append( (mod_name, sym, step, step_module, step_symbol) )
+
+    # routines
+    for cat in ('functions', 'subroutines'):
+        for subr in ast[cat]:
+            export_routine(mod_name, subr, None, subr['name'] in publics, rows, ids)
+
+    # types
+    for t in ast['types']:
+        rows['types'].append( (mod_name, t['name'], t['name'] in publics, text(t)) )
+        for position, v in enumerate(t['variables']):
+            rows['type_components'].append( (mod_name, t['name'], position, v['name'], v['type'], v['dim'],
+                                             ', '.join(v['attrs']), v.get('init'), text(v)) )
+
+    # interfaces
+    for i in ast['interfaces']:
+        iname = i['name']
+        rows['interfaces'].append( (mod_name, iname, i['task'], iname in publics, text(i)) )
+        for position, proc in enumerate(i['procedures']):
+            if isinstance(proc, dict):
+                export_routine(mod_name, proc, iname, iname in publics, rows, ids)
+                proc = proc['name']
+            rows['interface_procedures'].append( (mod_name, iname, position, proc) )
+
+    # USE edges
+    for u in ast['uses']:
+        if 'only' in u:
+            for local, remote in sorted(u['only'].iteritems()):
+                rows['uses'].append( (mod_name, u['from'], local, remote) )
+        else:
+            rows['uses'].append( (mod_name, u['from'], None, None) )
+
+#=============================================================================
+def export_routine(mod_name, subr, iname, public, rows, ids):
+    my_id = next(ids)
+    retval = subr['retval']
+    rows['routines'].append( (my_id, mod_name, subr['name'], subr['tag'], iname, public,
+                              ', '.join(subr['attrs']), retval['type'] if retval else None, text(subr)) )
+    for position, arg in enumerate(subr['args']):
+        rows['arguments'].append( (my_id, position, arg['name'], arg['type'], arg['intent'], arg['dim'],
+                                   ', '.join(arg['attrs']), text(arg)) )
+
+#=============================================================================
+def text(node):
+    """ The description of a node as written in the AST, not html-escaped; they
+        come as lists of lines (or None)."""
+    descr = utils.raw_descr(node)
+    return '\n'.join(descr) if isinstance(descr, list) else descr
+
+#=============================================================================
+if __name__ == '__main__':
+    main()
+
+#EOF
@@ -167,9 +167,9 @@ def activate_item_inplace(active_item_index, banner):
     for i, button in enumerate(buttons_list.pieces):
         link = button.pieces[0]
         if i == active_item_index:
-            link.attributes["class"] = "active"
+            link.addAttribute("class", "active")
         else:
-            dummy = link.attributes.pop("class", None)
+            dummy = link.popAttribute("class")
 
 #=============================================================================
 def commit_banner_dump_indices(banner, indices, prefix):
@@ -341,12 +341,7 @@ def get_tree(tree, modules_lists, modules_description, packages, sym_lookup_tabl
         for f in files:
             mod_name = f.rsplit(".", 1)[0].upper()
             if mod_name in sym_lookup_table:
-                my_mmap = {}
-                for k, v in sym_lookup_table[mod_name]['symbols_map'].iteritems():
-                    ext_module, external_sym_name = v.split(':',1)
-                    if(ext_module == '__HERE__'): # no forwarded symbols here...
-                        assert(k == external_sym_name)
-                        my_mmap[k] = k
+                my_mmap = sym_lookup_table[mod_name]['my_symbols'] # no forwarded symbols here...
                 if(my_mmap):
                     my_modules_map[mod_name.lower()] = my_mmap
 
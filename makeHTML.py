@@ -2,23 +2,35 @@
 # Copyright by Jerry Stratton
 #   (http://www.hoboes.com/Mimsy/hacks/object-oriented-html/)
 
+import re
+import sys
+
+# Shared by the tags without attributes: never modified, see addAttribute
+noAttributes = {}
+
 # Basic classes
-class newTag:
+class newTag(object):
+    # A page holds tens of thousands of tags: no per-instance __dict__, and the
+    # pieces given at creation are kept in a tuple, turned into a list only when
+    # pieces are added later on.
+    __slots__ = ('id', 'pieces', 'code', 'newlines', 'attributes')
+
     def __init__(self, code, content=None, style=None, id=None, attributes=None, newlines=True):
         self.id = id
-        self.pieces = []
         self.code = code
         self.newlines = newlines
 
-        if attributes == None:
-            self.attributes = {}
-        else:
+        if attributes:
             self.attributes = attributes
+        else:
+            self.attributes = noAttributes
 
         if isinstance(content, list):
-            self.addPieces(content)
+            self.pieces = tuple(content)
         elif content != None:
-            self.addPiece(content)
+            self.pieces = (content,)
+        else:
+            self.pieces = ()
 
     def __len__(self):
         return len(self.pieces)
@@ -36,24 +48,30 @@ class newTag:
         return ID
 
     def addAttribute(self, attributename, attributevalue):
+        if self.attributes is noAttributes:
+            self.attributes = {}
         self.attributes[attributename] = attributevalue
 
     def addAttributes(self, attributes):
         for attributename, attributevalue in attributes.iteritems():
             self.addAttribute(attributename, attributevalue)
 
+    def popAttribute(self, attributename):
+        if self.attributes is noAttributes:
+            return None
+        return self.attributes.pop(attributename, None)
+
     def addPart(self, code, content=None, style=None, id=None, attributes=None):
         newPart = self.makePart(code, content, style, id, attributes)
         self.addPiece(newPart)
 
     def addPiece(self, thePart):
-        self.pieces.append(thePart)
+        self.mutablePieces().append(thePart)
 
     def addPieces(self, theParts):
         if theParts != None:
             if isinstance(theParts, list):
-                for part in theParts:
-                    self.addPiece(part)
+                self.mutablePieces().extend(theParts)
             else:
                 self.addPiece(theParts)
 
@@ -62,26 +80,43 @@ class newTag:
         self.insertPiece(newPart)
 
     def insertPiece(self, thePart):
-        self.pieces.insert(0, thePart)
+        self.mutablePieces().insert(0, thePart)
+
+    def mutablePieces(self):
+        if isinstance(self.pieces, tuple):
+            self.pieces = list(self.pieces)
+        return self.pieces
 
     def make(self, tab="\t", level=0):
-        startHTML = '<' + self.code
+        """ The text of the tag, as write() streams it."""
+        chunks = ChunkedWriter(None, sys.maxint) # never flushed
+        self.writeChunks(chunks, tab, level)
+        return ''.join(chunks.pieces)
+
+    def write(self, sink, tab="\t", level=0, buffer_pieces=1<<12):
+        """ Stream the text of the tag into a file-like sink: the pieces are
+            handed over in chunks of about buffer_pieces strings."""
+        out = ChunkedWriter(sink, buffer_pieces)
+        self.writeChunks(out, tab, level)
+        out.flush()
+
+    def writeChunks(self, out, tab, level):
+        write = out.pieces.append
+        write('<' + self.code)
 
         if (self.attributes):
             for attribute in self.attributes:
                 content = self.attributes[attribute]
                 if content == None:
-                    startHTML += ' ' + attribute
+                    write(' ' + attribute)
                 else:
-                    startHTML += ' ' + attribute + '="' + str(content) + '"'
+                    write(' ' + attribute + '="' + str(content) + '"')
 
         if (self.id):
-            startHTML += ' id="' + self.id + '"'
+            write(' id="' + self.id + '"')
 
         if self.pieces:
-            startHTML += '>'
-
-            partItems = [startHTML]
+            write('>')
 
             if len(self.pieces) > 1 and self.newlines:
                 finalSep = "\n" + tab*level
@@ -91,31 +126,136 @@ class newTag:
                 sep = ""
 
             for piece in self.pieces:
+                if sep:
+                    write(sep)
                 if isinstance(piece, basestring):
-                    partItems.append(piece)
+                    write(piece)
                 elif isinstance(piece, int) or isinstance(piece, float):
-                    partItems.append(str(piece))
+                    write(str(piece))
                 elif isinstance(piece, newTag):
-                    partItems.append(piece.make(tab, level=level+1))
+                    piece.writeChunks(out, tab, level+1)
                 elif piece == None:
                     raise Exception('TAG: "%s"'%self.code)
-                    partItems.append("")
                 else:
                     assert(False)
 
-            code = sep.join(partItems)
-            code += finalSep + '</' + self.code + '>'
-            return code
+            write(finalSep + '</' + self.code + '>')
 
         else:
-            startHTML += ' />'
-            return startHTML
+            write(' />')
+
+        if len(out.pieces) >= out.buffer_pieces:
+            out.flush()
 
     def makePart(self, code, content=None, style=None, id=None, attributes=None):
         newPart = newTag(code, content, style, id, attributes)
 
         return newPart
 
+# Fragment templates: a fixed shape of markup, built once as a tree of tags
+# whose variable parts are Slots, made into text once per (tab, level) and then
+# filled with the values of each Fragment. The values go in verbatim, as they
+# would as pieces or attributes of the tags: tags are made at the level of their
+# slot, strings are only inserted (they are never parsed as template text).
+class Template(object):
+    def __init__(self, build, nslots):
+        self.build = build # build(*slots) -> newTag
+        self.nslots = nslots
+        self.compiled = {}
+
+    def __call__(self, *values):
+        assert(len(values) == self.nslots)
+        return Fragment(self, values)
+
+    def compile(self, tab, level):
+        key = (tab, level)
+        parts = self.compiled.get(key)
+        if parts is None:
+            text = self.build(*[Slot(i) for i in range(self.nslots)]).make(tab, level)
+            parts = re.split('\x00(\d+):(-?\d+)\x00', text)
+            # literal text, then (value index, level) pairs, each followed by literal text
+            parts = [parts[0]] + [x for i in range(1, len(parts), 3) for x in
+                        ((int(parts[i]), int(parts[i+1])), parts[i+2])]
+            self.compiled[key] = parts
+        return parts
+
+class Slot(newTag):
+    """ Where a value goes: as a piece (made at the level of the slot when the value
+        is a tag), or as (part of) a string, e.g. an attribute or an ID."""
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        newTag.__init__(self, None)
+        self.index = index
+
+    def __str__(self):
+        return '\x00%d:-1\x00' % self.index
+
+    def __nonzero__(self): # not an empty tag, e.g. as an ID
+        return True
+
+    def __add__(self, other):
+        return str(self) + other
+
+    def __radd__(self, other):
+        return other + str(self)
+
+    def writeChunks(self, out, tab, level):
+        out.pieces.append('\x00%d:%d\x00' % (self.index, level))
+
+class Fragment(newTag):
+    """ A filled Template, usable as a piece of any tag. The values are kept as
+        its pieces."""
+    __slots__ = ('template',)
+
+    def __init__(self, template, values):
+        newTag.__init__(self, None)
+        self.template = template
+        self.pieces = values
+
+    def writeChunks(self, out, tab, level):
+        write = out.pieces.append
+        values = self.pieces
+        for part in self.template.compile(tab, level):
+            if isinstance(part, tuple):
+                value = values[part[0]]
+                if isinstance(value, newTag):
+                    value.writeChunks(out, tab, part[1])
+                elif isinstance(value, basestring):
+                    write(value)
+                else:
+                    write(str(value))
+            else:
+                write(part)
+
+class ChunkedWriter:
+    """ Gather the pieces of text, hand them over to the sink in chunks."""
+    def __init__(self, sink, buffer_pieces):
+        self.sink = sink
+        self.buffer_pieces = buffer_pieces
+        self.pieces = []
+
+    def flush(self):
+        if self.pieces:
+            self.sink.write(''.join(self.pieces))
+            del self.pieces[:] # the same list, appended to by the tags being written
+
+def tagStats(tag):
+    """ Number of tags and bytes taken by the tree (the tags with their pieces
+        containers and attributes maps, not the strings)."""
+    nodes, size = 0, 0
+    todo = [tag]
+    while todo:
+        t = todo.pop()
+        nodes += 1
+        size += sys.getsizeof(t) + sys.getsizeof(t.pieces)
+        if hasattr(t, '__dict__'):
+            size += sys.getsizeof(t.__dict__)
+        if t.attributes is not noAttributes:
+            size += sys.getsizeof(t.attributes)
+        todo.extend(p for p in t.pieces if isinstance(p, newTag))
+    return nodes, size
+
 def Comment(comment):
     return '\n<!--\n    ' + comment + '\n' + (' '*(4+len(comment))) + '-->'
 
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import utils
+
+#=============================================================================
+def main():
+    if(len(sys.argv) != 3):
+        print("Usage: pack_asts.py <ASTs-dir> <bundle-file>")
+        sys.exit(1)
+
+    ast_dir = sys.argv[1]
+    bundle_file = sys.argv[2]
+
+    # pack all the (plain or compressed) AST files into a single bundle
+    n_files = utils.write_ast_bundle(ast_dir, bundle_file)
+    print("Packed %d AST files into %s" % (n_files, bundle_file))
+
+#=============================================================================
+if __name__ == '__main__':
+    main()
+
+#EOF
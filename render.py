@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from os import path
-from makeHTML import newTag, Comment
+from makeHTML import newTag, Comment, Template
 import re
 import utils
 
@@ -22,26 +22,31 @@ $(document).ready(function(){\n\
 #=============================================================================
 #   M O D U L E   (main rendering function)
 #=============================================================================
-def render_module(ast, rel_path, ast_dir, prefix, sym_lookup_table):
+def render_module(ast, rel_path, ast_dir, prefix, sym_lookup_table, users):
 
     # prefetch some info
     mod_name   = ast['name']
-    my_name    = mod_name.lower()
+    my_name    = ast['lname']
     my_file    = my_name + '.F'
     my_role    = ast['tag'].upper()
     my_title   = ' '.join(['Documentation for', my_role, my_name])
-    my_publics = set(f['name'] for f in ast['publics'])
+    my_publics = ast['__publics__']
     my_descr   = ast['descr'] if ast['descr'] else [missing_description]
     comment    = " ".join([my_role, my_name]).strip()
 
     # prefetch public symbols names
-    pars, types, intfs = (my_publics.intersection(s['name'] for s in ast[cat]) for cat in ('variables', 'types', 'interfaces'))
-    all_subs_funs  = ast['subroutines']+ast['functions']
-    functs_names = [s['name'] for s in all_subs_funs]
-    functs_publics = sorted(my_publics.intersection(functs_names))
-
-    my_symbols_map = sym_lookup_table[mod_name]['symbols_map']
-    my_symbols_cat = sym_lookup_table[mod_name]['symbols_cat']
+    index = ast['__index__']
+    pars, types, intfs = (my_publics.intersection(index[cat]) for cat in ('variables', 'types', 'interfaces'))
+    all_subs_funs = dict(index['functions'])
+    all_subs_funs.update(index['subroutines']) # subroutines first, as in the former list
+    functs_publics = sorted(my_publics.intersection(all_subs_funs))
+
+    # the entry is fetched once: a disk-backed table may hand out another copy later
+    # on, and the renderers mark the referenced private symbols in this one
+    my_entry       = sym_lookup_table[mod_name]
+    my_symbols_map = my_entry['symbols_map']
+    my_symbols_cat = my_entry['symbols_cat']
+    reset_vartype_links()
 
     # ...header
     logo = newTag('img', attributes={"src":'cp2k_apidoc_logo.svg', "alt":'Logo', "class":'logo', "title":"[back to start page]"})
@@ -67,28 +72,28 @@ def render_module(ast, rel_path, ast_dir, prefix, sym_lookup_table):
     # SUMMARIES...
 
     # ...forwarded symbols
-    forwarded = my_publics.difference(pars, types, intfs, functs_names)
+    forwarded = my_publics.difference(pars, types, intfs, all_subs_funs)
     if forwarded:
-        fwded_symbols = render_forwarded(forwarded, my_symbols_map, sym_lookup_table[mod_name]['symbols_forwarded'],
+        fwded_symbols = render_forwarded(forwarded, my_symbols_map, mod_name,
                                          sym_lookup_table, ast['uses'], ast['multiple_imports'])
         if fwded_symbols:
             body_parts.append(fwded_symbols)
 
     # ...types
     if types:
-        summary = types_summary(types, ast['types'])
+        summary = types_summary(types, index['types'])
         body_parts.append(summary)
 
     # ...interfaces summary (generic procedures)
     if intfs:
-        summary, specifics = interfaces_summary(intfs, ast['interfaces'], my_symbols_map)
+        summary, specifics = interfaces_summary(intfs, index['interfaces'], my_symbols_map)
         if summary:
             summary.addID('interfaces_list')
             body_parts.append(summary)
 
     # ...subroutines & functions (brief signatures)
     if functs_publics:
-        summary = routines_summary(functs_publics, ast['subroutines'], ast['functions'], my_symbols_map, referenced_private_syms)
+        summary = routines_summary(functs_publics, all_subs_funs, my_symbols_map, referenced_private_syms)
         summary.addID('routines_list')
         body_parts.append(summary)
 
@@ -97,7 +102,7 @@ def render_module(ast, rel_path, ast_dir, prefix, sym_lookup_table):
     # ...parameters & static vars
     if pars:
         body_parts.append(ruler)
-        paramts, statics, other = render_module_vars(ast['variables'], pars)
+        paramts, statics, other = render_module_vars(index['variables'], pars)
         if(paramts):
             p = render_parameters(paramts, my_symbols_map, referenced_private_syms)
             p.addID('parameters')
@@ -113,7 +118,7 @@ def render_module(ast, rel_path, ast_dir, prefix, sym_lookup_table):
 
     # ...types
     if types:
-        pubtypes = render_types_set('public', types, ast['types'], my_symbols_map, referenced_private_syms, rel_path)
+        pubtypes = render_types_set('public', types, index['types'], my_symbols_map, referenced_private_syms, rel_path)
         body_parts.extend([ruler] + pubtypes)
 
     # ...specific functions for interfaces (compact view)
@@ -121,19 +126,19 @@ def render_module(ast, rel_path, ast_dir, prefix, sym_lookup_table):
         body_parts.append(ruler)
         for sym in sorted(intfs):
             if(sym in specifics): # this is due to explicit interfaces
-                iface = render_interface(sym, ast, rel_path, ast_dir, specifics[sym], sym_lookup_table, referenced_private_syms)
+                iface = render_interface(sym, ast, rel_path, ast_dir, specifics[sym], sym_lookup_table, my_entry, referenced_private_syms)
                 body_parts.append(iface)
 
     # ...subroutines & functions
     if functs_publics:
         for sym in functs_publics:
             # ... function details
-            subr = render_routine(all_subs_funs[functs_names.index(sym)], my_symbols_map, referenced_private_syms, rel_path, ast_dir)
+            subr = render_routine(all_subs_funs[sym], my_symbols_map, referenced_private_syms, rel_path, ast_dir, sym_lookup_table)
             body_parts.append(subr)
 
     # ...abstract & explicit interfaces
     if intfs:
-        ifaces = render_explicit_interfaces(intfs, ast['interfaces'], my_symbols_map, referenced_private_syms, rel_path, ast_dir)
+        ifaces = render_explicit_interfaces(intfs, index['interfaces'], my_symbols_map, referenced_private_syms, rel_path, ast_dir, sym_lookup_table)
         body_parts.extend(ifaces)
 
     # ...specific functions details
@@ -142,24 +147,29 @@ def render_module(ast, rel_path, ast_dir, prefix, sym_lookup_table):
         spcf = []
         for sym in sorted(intfs):
             if(sym in specifics): # this is due to explicit interfaces
-                my_spcf, my_spnames = render_specifics(sym, specifics[sym], my_symbols_map, referenced_private_syms, all_subs_funs, rel_path, ast_dir)
+                my_spcf, my_spnames = render_specifics(sym, specifics[sym], my_symbols_map, referenced_private_syms, all_subs_funs, rel_path, ast_dir, sym_lookup_table)
                 spcf.extend(my_spcf)
                 sp_names.extend(my_spnames)
         body_parts.extend(spcf)
 
+    # ...users of the public symbols
+    used_by = render_used_by(my_entry['my_symbols'], mod_name, users)
+    if used_by:
+        body_parts.extend([ruler, used_by])
+
     # ...private but referenced stuff
-    todolists = get_referenced_privates(referenced_private_syms, my_symbols_map, ast, rel_path)
+    todolists = get_referenced_privates(referenced_private_syms, my_symbols_map, ast)
     privates_referenced = sp_names + todolists['PARAMS'] + todolists['TYPES']
 
     # ...private parameters
     priv_pars = todolists["PARAMS"]
-    paramts, statics, other = render_module_vars(ast['variables'], priv_pars)
+    paramts, statics, other = render_module_vars(ast['__index__']['variables'], priv_pars)
     assert(not (statics or other))
     prvpars = render_parameters(paramts, my_symbols_map, referenced_private_syms)
 
     # ...private types
     priv_types = todolists["TYPES"]
-    prvtypes = render_types_set('private', priv_types, ast['types'], my_symbols_map, referenced_private_syms, rel_path)
+    prvtypes = render_types_set('private', priv_types, ast['__index__']['types'], my_symbols_map, referenced_private_syms, rel_path)
 
     # ...private parameters & types
     if prvpars or prvtypes:
@@ -179,16 +189,15 @@ def render_module(ast, rel_path, ast_dir, prefix, sym_lookup_table):
 #===============================================================================
 #   I N T E R F A C E S   (generic procedures)
 #===============================================================================
-def render_specifics(ifname, my_specifics, my_symmap, referenced_private_syms, fun_asts, rel_path, ast_dir):
-    fnames = [f['name'] for f in fun_asts]
+def render_specifics(ifname, my_specifics, my_symmap, referenced_private_syms, fun_asts, rel_path, ast_dir, sym_lookup_table):
     sp_out, sp_names = [], []
     l2sort = my_specifics.pop('l2sort')
     for spname in l2sort:
-        owner_mod, ext_name = my_specifics[spname].split(':')
+        owner_mod, ext_name = my_specifics[spname]
         if(owner_mod == '__PRIV__'):
             assert(ext_name == spname)
-            my_ast = fun_asts[fnames.index(spname)]
-            fpriv = render_routine(my_ast, my_symmap, referenced_private_syms, rel_path, ast_dir)
+            my_ast = fun_asts[spname]
+            fpriv = render_routine(my_ast, my_symmap, referenced_private_syms, rel_path, ast_dir, sym_lookup_table)
             sp_out.append(fpriv)
             sp_names.append(spname)
         elif(owner_mod == '__HERE__'):
@@ -200,38 +209,67 @@ def render_specifics(ifname, my_specifics, my_symmap, referenced_private_syms, f
     return sp_out, sp_names
 
 #===============================================================================
-def render_interface(iname, ast, rel_path, ast_dir, specifics, sym_lookup_table, referenced_private_syms):
+def render_interface(iname, ast, rel_path, ast_dir, specifics, sym_lookup_table, my_entry, referenced_private_syms):
 
-    inames  = [s['name'] for s in ast['interfaces']]
-    my_ast  = ast['interfaces'][inames.index(iname)]
-    mod_name = ast['name']
+    my_ast  = ast['__index__']['interfaces'][iname]
     ext_href = make_external_url(rel_path, beg_end_loci=my_ast['beg_end_loci'])
 
-    my_name = iname.lower()
+    my_name = my_ast['lname']
     comment = " ".join(['INTERFACE', my_name])
 
-    sp, sp_symmap = import_specifics(specifics, ast, ast_dir, sym_lookup_table)
+    sp, sp_symmap = import_specifics(specifics, ast, ast_dir, sym_lookup_table, my_entry['symbols_cat'])
 
-    # tweak attributes to pop the info on INTENT and DIMENSION
-    args_list = [s['args'] for s in sp]
-    tweak_attrs_inplace(args_list)
-
-    specifics = render_specifics_compact(sp, sp_symmap, sym_lookup_table[mod_name]['symbols_map'], referenced_private_syms, my_name, ast_dir)
+    specifics = render_specifics_compact(sp, sp_symmap, my_entry['symbols_map'], referenced_private_syms, my_name, ast_dir)
 
     name_span = newTag('span', content=my_name, attributes={"class":"symname"})
     src_link = newTag('a', content=name_span, attributes={"href":ext_href, "target":'_blank'})
     header = newTag('h4', content=['Generic procedure ', src_link, top_link])
-    descr = sym_lookup_table[mod_name]['symbols_descr'][iname]
+    descr = my_entry['symbols_descr'][iname]
     descr_p = newTag('p', content=descr[0] if descr else missing_description)
     my_body = newTag('div', content=[Comment(comment), header, descr_p, specifics], attributes={"class":'box', "style":'overflow-x:auto;'}, id=my_name)
 
     return my_body
 
+#===============================================================================
+compact_rows = {} # (with intent, with attributes, specific routines) -> Template
+
+def compact_row(with_intent, with_attrs, nroutines):
+    """ The Template of an argument row of render_specifics_compact, for the given
+        shape; the type (a tag) ends with a comma when followed by the intent or
+        attributes."""
+    key = (with_intent, with_attrs, nroutines)
+    if not key in compact_rows:
+        def build(vtype, intent_str, attrs_str, aname_dim, *marks):
+            cols = []
+            cols.append( newTag('td', content=vtype, attributes={"class":'vtype', "style":"text-align:right"}) )
+
+            if with_intent:
+                intent = newTag('div', content=[intent_str, ','] if with_attrs else intent_str, attributes={"style":'padding-left:1ex;'}, newlines=False)
+                content = intent
+            else:
+                content = ''
+            cols.append( newTag('td', content=content, attributes={"class":'misc_attrs', "style":'text-align:left;'}) )
+
+            if with_attrs:
+                attrs = newTag('div', content=attrs_str, attributes={"style":'padding-left:1ex;'}, newlines=False)
+                content = attrs
+            else:
+                content = ''
+            cols.append( newTag('td', content=content, attributes={"class":'misc_attrs', "style":'text-align:left;'}) )
+
+            cols.append( newTag('td', content=separator, attributes={"class":'separee'}) )
+            cols.append( newTag('td', content=aname_dim, attributes={"class":'argname', "style":"text-align:left; padding-left:1ex;"}) )
+            for mark in marks:
+                cols.append( newTag('td', content=mark) )
+            return newTag('tr', content=cols, attributes={"class":'alternating'})
+        compact_rows[key] = Template(build, 4 + nroutines)
+    return compact_rows[key]
+
 #===============================================================================
 def render_specifics_compact(sp, sp_symmap, symmap, referenced_private_syms, my_name, ast_dir):
 
     # prefetch some specifics info
-    tags, names, args_list = ([s[k] for s in sp] for k in ('tag', 'name', 'args'))
+    tags, names, lnames, args_list = ([s[k] for s in sp] for k in ('tag', 'name', 'lname', 'args'))
     assert(len(set(tags)) == 1)
     tag = tags.pop()
 
@@ -240,10 +278,8 @@ def render_specifics_compact(sp, sp_symmap, symmap, referenced_private_syms, my_
     for i, args in enumerate(args_list): # i runs over specifics (columns)
         for j, a in enumerate(args):     # j runs over arguments (rows)
             aname = a['name']
-            a['attrs_str'] = ':'.join(sorted(a['attrs']))
-            a['name+dim'] = a['name'] + a['dim']
             signature = ':'.join([a[k] for k in 'type', 'intent', 'attrs_str', 'name+dim' if a[k]])
-            if signature in l2sort:
+            if signature in data:
                 data[signature]['routines'].append(names[i])
             else:
                 data[signature] = {'aname':a['name'], 'routines':[names[i]], 'orig_definition':(i,j)}
@@ -262,10 +298,9 @@ def render_specifics_compact(sp, sp_symmap, symmap, referenced_private_syms, my_
     # table header (specific routines names)
     empty_col = [newTag('th', content='')]
     names_th = []
-    for name in names:
-        sp_name = name.lower()
+    for name, sp_name in zip(names, lnames):
         assert(name in symmap)
-        owner_mod, ext_sym = symmap[name].split(':')
+        owner_mod, ext_sym = symmap[name]
         if(owner_mod in ('__HERE__', '__PRIV__')):
             assert(name == ext_sym)
             href = '#'+sp_name
@@ -283,58 +318,39 @@ def render_specifics_compact(sp, sp_symmap, symmap, referenced_private_syms, my_
         who_has = my_data['routines']
         i, j = my_data['orig_definition']
         a = args_list[i][j]
-        vtype = render_vartype(a['type'], merged_symmap, referenced_private_syms); last = vtype
-        cols = []
-        cols.append( newTag('td', content=vtype, attributes={"class":'vtype', "style":"text-align:right"}) )
-
-        if a['intent']:
-            last.addPiece(',')
-            intent = newTag('div', content='INTENT(%s)'%a['intent'].lower(), attributes={"style":'padding-left:1ex;'}, newlines=False)
-            content = intent
-            last = intent
-        else:
-            content = ''
-        cols.append( newTag('td', content=content, attributes={"class":'misc_attrs', "style":'text-align:left;'}) )
-
-        if a['attrs_str']:
-            last.addPiece(',')
-            attrs = newTag('div', content=', '.join(a['attrs']), attributes={"style":'padding-left:1ex;'}, newlines=False)
-            content = attrs
-        else:
-            content = ''
-        cols.append( newTag('td', content=content, attributes={"class":'misc_attrs', "style":'text-align:left;'}) )
-
-        cols.append( newTag('td', content=separator, attributes={"class":'separee'}) )
-        cols.append( newTag('td', content=a['name+dim'].lower(), attributes={"class":'argname', "style":"text-align:left; padding-left:1ex;"}) )
-        for name in names:
-            content = '&times;' if name in who_has else ''
-            cols.append( newTag('td', content=content) )
-        rows.append( newTag('tr', content=cols, attributes={"class":'alternating'}) )
+        vtype = render_vartype(a['type'], merged_symmap, referenced_private_syms)
+        if a['intent'] or a['attrs_str']:
+            vtype.addPiece(',')
+        template = compact_row(bool(a['intent']), bool(a['attrs_str']), len(names))
+        marks = ['&times;' if name in who_has else '' for name in names]
+        rows.append( template(vtype, 'INTENT(%s)'%a['intent'].lower(), ', '.join(a['attrs']), a['name+dim'].lower(), *marks) )
 
     table = newTag('table', content=rows, attributes={"border":'0', "style":"text-align:center; border-collapse:collapse;"})
     my_body = newTag('div', content=table)
     return my_body
 
 #===============================================================================
-def import_specifics(specifics, ast, ast_dir, sym_lookup_table):
+def import_specifics(specifics, ast, ast_dir, sym_lookup_table, my_symbols_cat):
     sp, sp_symmap = [], []
     sp_sorting = specifics['l2sort']
     for k in sp_sorting:
         v = specifics[k]
-        module, external_sym = v.split(':',1)
+        module, external_sym = v
         symmap = {}
+        cat = my_symbols_cat[k]
         if(module == '__HERE__' or module == '__PRIV__'):
-            target_ast = ast
+            sp.append(ast['__index__'][cat][external_sym])
         else:
-            mfile = path.join(ast_dir, module.lower()+'.ast')
-            target_ast = utils.read_ast(mfile, do_doxycheck=False)
+            # only the wanted routine is needed from the imported module
+            mfile = utils.module_ast_file(ast_dir, module)
+            sp.append(utils.ast_store.get_symbol(mfile, cat, external_sym))
 
             # copy the symmap (and tweak it when it contains symbols local to the imported module!)
             for key, val in sym_lookup_table[module]['symbols_map'].iteritems():
                 assert(not key in symmap)
-                m, ext_s = val.split(':',1)
+                m, ext_s = val
                 if m == '__HERE__':
-                    symmap[key] = ':'.join([module, ext_s])
+                    symmap[key] = utils.symbol_ref(module, ext_s)
                 elif m in ('__PRIV__', '__REFERENCED_PRIV__'):
                     pass
                 elif m == '__MULTI__':
@@ -343,39 +359,32 @@ def import_specifics(specifics, ast, ast_dir, sym_lookup_table):
                     assert(not re.match('__\w+__', m))
                     symmap[key] = val
 
-        cat = sym_lookup_table[ast['name']]['symbols_cat'][k]
-        sp.append(next( (item for item in target_ast[cat] if item['name'] == external_sym), None ))
         sp_symmap.append(symmap)
     return sp, sp_symmap
 
 #===============================================================================
-def tweak_attrs_inplace(args_list):
-    for arg in utils.traverse(args_list):
-        attrs = arg['attrs']
-        intent = next((a for a in attrs if a.startswith("INTENT(")), "")
-        if(intent):
-            attrs.remove(intent)
-            intent = re.match("INTENT\((.+)\)$",intent).group(1)
-            assert(not 'intent' in arg)
-            arg['intent'] = intent
-        else:
-            if not 'intent' in arg:
-                arg['intent'] = ""
-        dim = next((a for a in attrs if a.startswith("DIMENSION(")), "")
-        if(dim):
-            attrs.remove(dim)
-            if(not arg['dim']):
-                arg['dim'] = re.match("DIMENSION(\(.+\))$",dim).group(1)
+def build_specific_item(href, sym_name):
+    link = newTag('a', content=sym_name, attributes={"href":href})
+    return newTag('div', content=['&#8226;', link], attributes={"style":'padding-left:1em; display:inline;'})
+
+specific_item = Template(build_specific_item, 2)
+
+#===============================================================================
+def build_generic_row(bg_color, gen_name, specific_div):
+    gen_link = newTag('a', content=gen_name, id='_SUMMARY_'+gen_name, attributes={"href":'#'+gen_name})
+    generic_sym  = newTag('div', content=gen_link, newlines=False, attributes={"style":'font-weight:bold; padding:5px;'})
+    return newTag('div', content=[generic_sym, specific_div], attributes={"style":'padding:1ex; background-color:'+bg_color})
+
+generic_row = Template(build_generic_row, 3)
 
 #===============================================================================
 def interfaces_summary(names, intfcs, symmap):
-    inames = [s['name'] for s in intfcs]
 
     yes = False
     specifics = {}
     sym_divs = []
     for ifname in sorted(names):
-        iface = intfcs[inames.index(ifname)]
+        iface = intfcs[ifname]
         if(iface['task'] == 'overloading'):
 
             procedures = iface['procedures']
@@ -385,22 +394,19 @@ def interfaces_summary(names, intfcs, symmap):
                 specifics[ifname][specific] = symmap[specific]
                 sym_name = specific.lower()
 
-                owner_mod, ext_sym = symmap[specific].split(':')
+                owner_mod, ext_sym = symmap[specific]
                 if(owner_mod in ('__HERE__', '__PRIV__')):
                     href = '#'+sym_name
                 else:
                     assert(not re.match('__\w+__',owner_mod))
                     href = filename(owner_mod.lower(), hashtag=ext_sym.lower())
 
-                link = newTag('a', content=sym_name, attributes={"href":href})
-                items.append( newTag('div', content=['&#8226;', link], attributes={"style":'padding-left:1em; display:inline;'}) )
+                items.append( specific_item(href, sym_name) )
 
             bg_color  = '#f2f2f2' if yes else 'white'
             yes = not yes
-            gen_link = newTag('a', content=ifname.lower(), id='_SUMMARY_'+ifname.lower(), attributes={"href":'#'+ifname.lower()})
-            generic_sym  = newTag('div', content=gen_link, newlines=False, attributes={"style":'font-weight:bold; padding:5px;'})
             specific_div = newTag('div', content=items, attributes={"class":'ellipsed', "style":'padding-left:5px;'})
-            sym_divs.append( newTag('div', content=[generic_sym, specific_div], attributes={"style":'padding:1ex; background-color:'+bg_color}) )
+            sym_divs.append( generic_row(bg_color, ifname.lower(), specific_div) )
 
     if sym_divs:
         container = newTag('div', content=sym_divs, attributes={"class":'box', "style":'font-family:monospace;'})
@@ -413,26 +419,25 @@ def interfaces_summary(names, intfcs, symmap):
 #===============================================================================
 #   I N T E R F A C E S   (abstract & explicit ones)
 #===============================================================================
-def render_explicit_interfaces(names, intfcs, symmap, referenced_private_syms, rel_path, ast_dir):
-    inames = [s['name'] for s in intfcs]
+def render_explicit_interfaces(names, intfcs, symmap, referenced_private_syms, rel_path, ast_dir, sym_lookup_table):
     divs = []
     # abstract ones
     for ifname in sorted(names):
-        iface = intfcs[inames.index(ifname)]
+        iface = intfcs[ifname]
         if(iface['task'] == 'abstract_interface'):
             ast = iface['procedures'][0]
-            divs.append(render_routine(ast, symmap, referenced_private_syms, rel_path, ast_dir))
-            divs[-1].pieces.insert(0, 'Abstract interface')
+            divs.append(render_routine(ast, symmap, referenced_private_syms, rel_path, ast_dir, sym_lookup_table))
+            divs[-1].insertPiece('Abstract interface')
     # explicit ones
     for ifname in sorted(names):
-        iface = intfcs[inames.index(ifname)]
+        iface = intfcs[ifname]
         if(iface['task'] == 'explicit_interface'):
             assert(len(iface['procedures']))
             ast = iface['procedures'][0]
-            div = render_routine(ast, symmap, referenced_private_syms, rel_path, ast_dir)
+            div = render_routine(ast, symmap, referenced_private_syms, rel_path, ast_dir, sym_lookup_table)
             target_name = div.popID()
             div.addID(ifname.lower())
-            div.pieces.insert(0, 'Explicit interface to '+target_name)
+            div.insertPiece('Explicit interface to '+target_name)
             divs.append(div)
     if divs:
         divs.insert(0, newTag('h5', content="Abstract/Explicit interfaces", id='explicit_interfaces'))
@@ -441,20 +446,25 @@ def render_explicit_interfaces(names, intfcs, symmap, referenced_private_syms, r
 #===============================================================================
 #   S U B R O U T I N E S   and   F U N C T I O N S
 #===============================================================================
-def routines_summary(names, subs, funs, symmap, referenced_private_syms):
-    snames = [s['name'] for s in subs]
-    fnames = [s['name'] for s in funs]
+def build_routine_row(bg_color, f_signature, descr):
+    description = newTag('div', content=newTag('span', content=descr), attributes={"class":'ellipsed', "style":'padding-left:5px;'})
+    return newTag('div', content=[f_signature, description], attributes={"style":'padding:1ex; background-color:'+bg_color})
+
+routine_row = Template(build_routine_row, 3)
+
+#===============================================================================
+def routines_summary(names, subs_funs, symmap, referenced_private_syms):
 
     # symbols list
     sym_divs = []
     for i, sym in enumerate(names):
-        my_ast = subs[snames.index(sym)] if sym in snames else funs[fnames.index(sym)]
+        my_ast = subs_funs[sym]
 
         preattrs  = ' '.join(my_ast['attrs']+[''])
         retval    = my_ast['retval']['type'] if my_ast['retval'] else ''
         tag       = my_ast['tag'].upper() + ' '
-        sym_name  = sym.lower()
-        arglist   = [a['name'].lower() for a in my_ast['args']]
+        sym_name  = my_ast['lname']
+        args      = my_ast['args']
         postattrs = ' '.join(my_ast['post_attrs']) if 'post_attrs' in my_ast else ''
         descr     = '. '.join(my_ast['descr']) if my_ast['descr'] else missing_description
         bg_color  = '#f2f2f2' if i%2==1 else 'white'
@@ -475,21 +485,19 @@ def routines_summary(names, subs, funs, symmap, referenced_private_syms):
             tooltip = newTag('div', content=tag, attributes={"style":'display:inline-block;'})
         div_pieces = [tooltip, ' ', newTag('a', content=sym_name, id='_SUMMARY_'+sym_name, attributes={"href":'#'+sym_name}), ' ']
 
-        if(arglist):
+        if(args):
             div_pieces.append('(')
-            for arg in arglist:
+            for a in args:
+                arg = a['lname']
                 a_attributes = {"href":'#'+sym_name, "onclick":"javascript:highlightArgument('"+':'.join([sym_name, arg])+"')"}
-                arg_attrs = my_ast['args'][arglist.index(arg)]['attrs']
-                if 'OPTIONAL' in arg_attrs:
+                if 'OPTIONAL' in a['attrs']:
                     a_attributes["class"] = 'optional_argument'
                 div_pieces.extend( [newTag('a', content=arg, attributes=a_attributes), ', '] )
             assert(div_pieces.pop() == ', ')
             div_pieces.append(')')
 
         f_signature = newTag('div', content=div_pieces, attributes={"class":'ellipsed ellipsed_arglist', "style":'font-weight:bold; padding:5px;'}, newlines=False)
-        description = newTag('div', content=newTag('span', content=descr), attributes={"class":'ellipsed', "style":'padding-left:5px;'})
-
-        sym_divs.append( newTag('div', content=[f_signature, description], attributes={"style":'padding:1ex; background-color:'+bg_color}) )
+        sym_divs.append( routine_row(bg_color, f_signature, descr) )
 
     container = newTag('div', content=sym_divs, attributes={"class":'box', "style":'font-family:monospace;'})
 
@@ -498,27 +506,53 @@ def routines_summary(names, subs, funs, symmap, referenced_private_syms):
     return my_body
 
 #===============================================================================
-def render_routine(subr, module_symmap, referenced_private_syms, rel_path, ast_dir):
+argument_rows = {} # (with intent, with attributes, description lines) -> Template
+
+def argument_row(with_intent, with_attrs, ndescr):
+    """ The Template of an argument row of render_routine, for the given shape; the
+        type (a tag) ends with a comma when followed by the intent or attributes."""
+    key = (with_intent, with_attrs, ndescr)
+    if not key in argument_rows:
+        def build(vtype, intent_str, my_attrs, aname_dim, span_id, *descr):
+            r = newTag('tr', attributes={"style":'font-family:courier;'})
+            r.addPart('td', content=vtype, attributes={"class":'vtype'})
+            if with_intent:
+                intent = newTag('div', content=[intent_str, ','] if with_attrs else intent_str, attributes={"style":'padding-left:1ex;'}, newlines=False)
+                r.addPart('td', content=intent)
+            else:
+                r.addPart('td', content='')
+            if with_attrs:
+                attrs = newTag('div', content=my_attrs, attributes={"style":'padding-left:1ex;'})
+                r.addPart('td', content=attrs)
+            else:
+                r.addPart('td', content='')
+            r.addPart('td', content=separator, attributes={"class":'separee'})
+            r.addPart('td', content=newTag('span', content=aname_dim, id=span_id))
+
+            r.addPart('td', content=list(descr), attributes={"style":'padding-left:2em; font-family:Liberation Serif;'})
+            return r
+        argument_rows[key] = Template(build, 5 + ndescr)
+    return argument_rows[key]
+
+#===============================================================================
+def render_routine(subr, module_symmap, referenced_private_syms, rel_path, ast_dir, sym_lookup_table):
 
     # fetch routine's info
-    my_name    = subr['name'].lower()
+    my_name    = subr['lname']
     my_role    = subr['tag'].upper()
     pre_attrs  = " ".join(subr['attrs'])
     post_attrs = " ".join(subr['post_attrs']) if 'post_attrs' in subr else ''
-    my_arglist = [arg['name'] for arg in subr['args']]
-    my_args    = '(' + ", ".join(my_arglist).lower() + ')'
+    my_args    = '(' + ", ".join(arg['lname'] for arg in subr['args']) + ')'
     my_retval  = subr['retval']
     my_title   = ' '.join(['DBCSR', my_role, my_name])
     my_descr   = subr['descr'] if subr['descr'] else [missing_description]
 
     comment = " ".join([pre_attrs, my_role, my_name, my_args, post_attrs]).strip()
     if(my_retval and subr['name']!=my_retval['name']):
-        comment += " RESULT(%s)"%my_retval['name'].lower()
+        comment += " RESULT(%s)"%my_retval['lname']
 
     if subr['uses']:
-        my_sym_lookup_table = {}
-        utils.cache_symbol_lookup(subr, ast_dir, my_sym_lookup_table)
-        internal_symmap = my_sym_lookup_table[subr['name']]['symbols_map']
+        internal_symmap = utils.routine_symbols_map(subr, ast_dir, sym_lookup_table)
         my_symbols_map = dict(module_symmap)
         for sym in internal_symmap:
             if sym in my_symbols_map:
@@ -565,46 +599,20 @@ def render_routine(subr, module_symmap, referenced_private_syms, rel_path, ast_d
 
     # arguments description
     if(subr['args']):
-
-        if '__grouped_args_descr__' in subr:
-            for group in subr['__grouped_args_descr__']:
-                for aname in group['grouped_args']:
-                    # just copy the description into all the arguments of this group
-                    a = subr['args'][my_arglist.index(aname)]
-                    assert(not a['descr'])
-                    a['descr'] = group['descr']
-
-        tweak_attrs_inplace([subr['args']])
         rows = []
         for a in subr['args']:
             my_attrs = ", ".join(a['attrs'])
             my_intnt = a['intent'].lower()
-            aname = a['name'].lower()
+            aname = a['lname']
             adim  = (a['dim'] or '').lower()
             descr = a['descr'] if a['descr'] else missing_description
 
-            r = newTag('tr', attributes={"style":'font-family:courier;'})
             vtype = render_vartype(a['type'], my_symbols_map, referenced_private_syms)
-            r.addPart('td', content=vtype, attributes={"class":'vtype'})
-            last  = vtype
-            if my_intnt:
-                last.addPiece(',')
-                intent = newTag('div', content='INTENT(%s)'%my_intnt, attributes={"style":'padding-left:1ex;'}, newlines=False)
-                r.addPart('td', content=intent)
-                last = intent
-            else:
-                r.addPart('td', content='')
-            if my_attrs:
-                last.addPiece(',')
-                attrs = newTag('div', content=my_attrs, attributes={"style":'padding-left:1ex;'})
-                r.addPart('td', content=attrs)
-            else:
-                r.addPart('td', content='')
-            r.addPart('td', content=separator, attributes={"class":'separee'})
-            r.addPart('td', content=newTag('span', content=aname+adim, id=':'.join([my_name, aname])))
-
-            r.addPart('td', content=descr, attributes={"style":'padding-left:2em; font-family:Liberation Serif;'})
-            rows.append(r)
+            if my_intnt or my_attrs:
+                vtype.addPiece(',')
+            descr = descr if isinstance(descr, list) else [descr]
+            template = argument_row(bool(my_intnt), bool(my_attrs), len(descr))
+            rows.append( template(vtype, 'INTENT(%s)'%my_intnt, my_attrs, aname+adim, ':'.join([my_name, aname]), *descr) )
 
         t = newTag('table', content=rows, attributes={"style":'border:0px'})
         body_parts.extend( [newTag('h5', content='Arguments:'), t] )
@@ -617,10 +625,9 @@ def render_routine(subr, module_symmap, referenced_private_syms, rel_path, ast_d
 #===============================================================================
 def render_module_vars(variables, vpublics):
     # 'variables' can be only static variables or parameters
-    vnlist = [v['name'] for v in variables]
     paramts, statics, other = [], [], []
     for vname in vpublics:
-        v = variables[vnlist.index(vname)]
+        v = variables[vname]
         if('PARAMETER' in v['attrs']):
             assert(not 'SAVE' in v['attrs'])
             paramts.append(v)
@@ -635,15 +642,16 @@ def render_module_vars(variables, vpublics):
 #===============================================================================
 def render_parameters(paramts, my_symbols_map, referenced_private_syms, hint='PARAMETER'):
     names = [v['name'] for v in paramts]
+    by_name = dict((v['name'], v) for v in paramts)
     rows = []
     for sym in sorted(names):
 
         assert(sym in my_symbols_map)
-        owner_mod, ext_sym = my_symbols_map[sym].split(':')
+        owner_mod, ext_sym = my_symbols_map[sym]
 
         if owner_mod in ('__HERE__', '__REFERENCED_PRIV__'):
-            v = paramts[names.index(sym)]
-            sym_name = sym.lower()
+            v = by_name[sym]
+            sym_name = v['lname']
 
             attrs  = v['attrs'][:]
             if hint:
@@ -676,7 +684,7 @@ def render_parameters(paramts, my_symbols_map, referenced_private_syms, hint='PA
             row.addPart('td', content=v_name, id=sym_name, attributes={"class":"parname"})
             rows.append(row)
         else:
-            raise Exception('"%s"'%my_symbols_map[sym])
+            raise Exception('"%s:%s"'%my_symbols_map[sym])
 
     if rows:
         what = 'Other:'
@@ -699,13 +707,13 @@ def render_othervars(*args):
 #   T Y P E S
 #===============================================================================
 def types_summary(typenames, ast):
-    alltypenames = [t['name'] for t in ast]
     sym_divs = []
     for i, sym in enumerate(typenames):
-        t = ast[alltypenames.index(sym)]
+        t = ast[sym]
         assert(sym == t['name'])
+        sym_name = t['lname']
         my_descr = t['descr'] if t['descr'] else missing_description
-        link = newTag('a', content=sym.lower(), id='_SUMMARY_'+sym.lower(), attributes={"href":'#'+sym.lower()})
+        link = newTag('a', content=sym_name, id='_SUMMARY_'+sym_name, attributes={"href":'#'+sym_name})
 
         bg_color  = '#f2f2f2' if i%2==1 else 'white'
         type_div  = newTag('div', content=link, newlines=False, attributes={"style":'font-weight:bold; padding:5px;'})
@@ -719,22 +727,21 @@ def types_summary(typenames, ast):
 
 #===============================================================================
 def render_types_set(tag, names, ast, my_symbols_map, referenced_private_syms, rel_path):
-    type_names = [s['name'] for s in ast]
 
     t_pieces = []
     for sym in sorted(names):
 
         assert(sym in my_symbols_map)
-        owner_mod, ext_sym = my_symbols_map[sym].split(':')
+        owner_mod, ext_sym = my_symbols_map[sym]
         if owner_mod in ('__HERE__', '__REFERENCED_PRIV__'):
-            my_ast = ast[type_names.index(sym)]
+            my_ast = ast[sym]
             t = render_type(my_ast, my_symbols_map, referenced_private_syms, rel_path)
-            box = newTag('div', content=t, id=sym.lower(), attributes={"class":'box'})
+            box = newTag('div', content=t, id=my_ast['lname'], attributes={"class":'box'})
             t_pieces.append( box )
         elif owner_mod == '__PRIV__':
             pass
         else:
-            raise Exception('"%s"'%my_symbols_map[sym])
+            raise Exception('"%s:%s"'%my_symbols_map[sym])
 
     if t_pieces:
         t_pieces.insert(0, newTag('h5', content=tag+" Types:", id='types_'+tag))
@@ -742,7 +749,7 @@ def render_types_set(tag, names, ast, my_symbols_map, referenced_private_syms, r
 
 #===============================================================================
 def render_type(tp, my_symbols_map, referenced_private_syms, rel_path):
-    my_name = tp['name'].lower()
+    my_name = tp['lname']
     my_descr = tp['descr'] if tp['descr'] else missing_description
     my_attrs = tp['attrs'] if 'attrs' in tp else ""
     comment = " ".join([tp['tag'].upper(), my_name])
@@ -772,7 +779,7 @@ def render_type(tp, my_symbols_map, referenced_private_syms, rel_path):
         else:
             v_init = ''
 
-        v_name = v['name'].lower() + v_init
+        v_name = v['lname'] + v_init
         v_descr = v['descr'] if v['descr'] else missing_description
         v_type = render_vartype(v['type'], my_symbols_map, referenced_private_syms)
         v_attr = ', '.join(v['attrs'])
@@ -796,14 +803,17 @@ def render_type(tp, my_symbols_map, referenced_private_syms, rel_path):
 #   U T I L I T I E S
 #===============================================================================
 external_stuff = {}
-def render_vartype(vtype, symmap, referenced_private_syms):
-    global external_stuff
-    if(not vtype):
-        return ''
+parsed_vartypes = {} # type string -> (type, spec items), see parse_vartype
+vartype_links = {}   # id(symmap) -> (symmap, {type string: (pieces, linked symbols)})
+
+def parse_vartype(vtype):
+    """ The type and its spec, once per type string: the spec is None, a string (no
+        symbols in it) or a list of (item, may be a symbol) tuples."""
+    if vtype in parsed_vartypes:
+        return parsed_vartypes[vtype]
     var_type, spec = re.match("([A-Z]+)(?:\((.+)\))?", vtype).groups()
-    pieces = [var_type]
+    items = None
     if(spec):
-        s_lowcase = spec.lower()
         meq = re.match('(\w+)=(.+)$',spec)
         mkw = re.match('(\w+)$',spec)
         assert(not (meq and mkw))
@@ -812,31 +822,76 @@ def render_vartype(vtype, symmap, referenced_private_syms):
             inner_spec = m.groups()[-1]
             inner_split = re.split('(\W+)', inner_spec)
             assert(''.join(inner_split) == inner_spec)
-            pieces.append('(')
-            for item in inner_split:
-                do_href = bool(re.match('\w+$', item)) and item in symmap
-                do_href = do_href and (not item.isdigit())
-                if do_href:
-                    owner_module, remote_sym = symmap[item].split(':')
-                    if owner_module in utils.external_modules:
-                        external_stuff.setdefault(owner_module.lower(), set()).add(remote_sym.lower())
-                    elif owner_module=='__PRIV__':
-                        assert(item == remote_sym)
-                        symmap[item] = ':'.join(["__REFERENCED_PRIV__", remote_sym])
-                        what = "TYPES" if var_type == "TYPE" else "PARAMS"
-                        referenced_private_syms[what].append(item)
-                    attributes = {"href":filename(owner_module.lower(), hashtag=remote_sym.lower())}
-                    if (item != remote_sym):
-                        attributes["title"] = "target: "+"::".join([owner_module, remote_sym]).lower()
-                    pieces.append(newTag('a', content=item.lower(), attributes=attributes))
-                else:
-                    pieces.append(item.lower())
-            pieces.append(')')
+            items = [(item, bool(re.match('\w+$', item)) and not item.isdigit()) for item in inner_split]
         else:
-            pieces.append('('+s_lowcase+')')
+            items = '('+spec.lower()+')'
+    parsed_vartypes[vtype] = (var_type, items)
+    return var_type, items
+
+def reset_vartype_links():
+    """ Drop the links memo, which keeps the symbol maps alive: once per module."""
+    vartype_links.clear()
+
+def render_vartype(vtype, symmap, referenced_private_syms):
+    if(not vtype):
+        return ''
+    key = id(symmap)
+    if not key in vartype_links:
+        vartype_links[key] = (symmap, {})
+    links = vartype_links[key][1]
+    if not vtype in links:
+        links[vtype] = link_vartype(vtype, symmap)
+    pieces, linked = links[vtype]
+    reference_symbols(pieces[0], linked, symmap, referenced_private_syms) # on every call
     h = newTag('div', content=pieces, newlines=False)
     return h
 
+def reference_vartype(vtype, symmap, referenced_private_syms):
+    """ The side effects of render_vartype only, without building its HTML."""
+    if(not vtype):
+        return
+    var_type, items = parse_vartype(vtype)
+    if isinstance(items, list):
+        linked = [item for item, maybe_symbol in items if maybe_symbol and item in symmap]
+        reference_symbols(var_type, linked, symmap, referenced_private_syms)
+
+def reference_symbols(var_type, linked, symmap, referenced_private_syms):
+    """ Record the external symbols, and queue the private ones met for the first
+        time (marking them as referenced in the symbol map)."""
+    for item in linked:
+        owner_module, remote_sym = symmap[item]
+        if owner_module in utils.external_modules:
+            external_stuff.setdefault(owner_module.lower(), set()).add(remote_sym.lower())
+        elif owner_module=='__PRIV__':
+            assert(item == remote_sym)
+            symmap[item] = utils.symbol_ref("__REFERENCED_PRIV__", remote_sym)
+            what = "TYPES" if var_type == "TYPE" else "PARAMS"
+            referenced_private_syms[what].append(item)
+
+def link_vartype(vtype, symmap):
+    """ The pieces of a type string, its symbols linked through the symbol map,
+        and the symbols linked, in order."""
+    var_type, items = parse_vartype(vtype)
+    pieces = [var_type]
+    linked = []
+    if isinstance(items, list):
+        pieces.append('(')
+        for item, maybe_symbol in items:
+            if maybe_symbol and item in symmap:
+                owner_module, remote_sym = symmap[item]
+                # private symbols are linked alike, before and after being referenced
+                attributes = {"href":filename(owner_module.lower(), hashtag=remote_sym.lower())}
+                if (item != remote_sym):
+                    attributes["title"] = "target: "+"::".join([owner_module, remote_sym]).lower()
+                pieces.append(newTag('a', content=item.lower(), attributes=attributes))
+                linked.append(item)
+            else:
+                pieces.append(item.lower())
+        pieces.append(')')
+    elif items:
+        pieces.append(items)
+    return pieces, linked
+
 #===============================================================================
 def render_external(prefix):
     for ext_module, symbols in external_stuff.iteritems():
@@ -852,7 +907,21 @@ def render_external(prefix):
         printout(body, prefix, title=ext_module, output_file=ext_module)
 
 #===============================================================================
-def render_forwarded(forwarded, my_symbols_map, my_forwardings,
+def build_import_step(href, text):
+    link = newTag('a', content=text, attributes={"href":href})
+    return newTag('div', content=[' &RightArrow; ', link], attributes={"style":'padding-left:1em; display:inline-block;'})
+
+import_step = Template(build_import_step, 2)
+
+#===============================================================================
+def build_forwarded_row(bg_color, forwarded_sym, descr):
+    descr_div = newTag('div', content=descr, attributes={"class":'ellipsed', "style":'padding-left:5px;'})
+    return newTag('div', content=[forwarded_sym, descr_div], attributes={"style":'font-family:monospace; padding:1ex; background-color:'+bg_color})
+
+forwarded_row = Template(build_forwarded_row, 3)
+
+#===============================================================================
+def render_forwarded(forwarded, my_symbols_map, mod_name,
                      sym_lookup_table, uses, multiple_imports):
 
     # precalculate the symbols to be printed
@@ -864,12 +933,11 @@ def render_forwarded(forwarded, my_symbols_map, my_forwardings,
     for sym in sym_list:
         assert isinstance(sym_to_mod[sym], list)
         if len(sym_to_mod[sym])==1:
-            imported_module, remote_sym = sym_to_mod[sym][0].split(':')
+            imported_module, remote_sym = sym_to_mod[sym][0]
             todolist.setdefault(imported_module, []).append(sym)
         else:
             assert sym in multiple_imports
-            for target in sym_to_mod[sym]:
-                imported_module, remote_sym = target.split(':')
+            for imported_module, remote_sym in sym_to_mod[sym]:
                 todolist.setdefault(imported_module, []).append(sym)
     if not todolist:
         return
@@ -886,28 +954,29 @@ def render_forwarded(forwarded, my_symbols_map, my_forwardings,
             sym_name = sym.lower()
             sym_span = newTag('span', content=sym_name, id=sym_name, attributes={"style":'font-weight:bold;'})
             assert (sym in my_symbols_map)
-            # my_forwardings is used only when multiple steps are needed to reach the original location of the symbol
-            chain = my_forwardings[sym] if sym in my_forwardings else [my_symbols_map[sym]]
+            if my_symbols_map[sym][0] == '__MULTI__':
+                chain = [my_symbols_map[sym]]
+            else:
+                # the steps needed to reach the original location of the symbol
+                chain = utils.forward_chain(mod_name, sym, sym_lookup_table)
             import_steps = []
-            for ring in chain:
-                owner_module, remote_sym = ring.lower().split(':',1)
-                if owner_module.upper()=='__MULTI__':
+            for owner_module, remote_sym in chain:
+                if owner_module=='__MULTI__':
                     # only one ring(step) is allowed here!
                     assert(len(chain)==1)
-                    assert(":".join([imported_module, sym_name]).upper() in multiple_imports[sym])
+                    assert(utils.symbol_ref(imported_module.upper(), sym) in remote_sym)
                     owner_module, remote_sym = imported_module, sym_name
+                else:
+                    owner_module, remote_sym = owner_module.lower(), remote_sym.lower()
                 assert(not re.match('__\w+__',owner_module))
                 href = filename(owner_module, hashtag=remote_sym)
-                link = newTag('a', content='::'.join([owner_module, remote_sym]), attributes={"href":href})
-                import_steps.append( newTag('div', content=[' &RightArrow; ', link], attributes={"style":'padding-left:1em; display:inline-block;'}) )
+                import_steps.append( import_step(href, '::'.join([owner_module, remote_sym])) )
 
             forwarded_sym  = newTag('div', content=[sym_span]+import_steps, newlines=False, attributes={"style":'padding:5px;'})
 
             # the last ring in chain gives this (owner_module, remote_sym)
             descr = sym_lookup_table[owner_module.upper()]['symbols_descr'][remote_sym.upper()]
-            descr_div = newTag('div', content=descr[0] if descr else missing_description, attributes={"class":'ellipsed', "style":'padding-left:5px;'})
-
-            sym_divs.append( newTag('div', content=[forwarded_sym, descr_div], attributes={"style":'font-family:monospace; padding:1ex; background-color:'+bg_color}) )
+            sym_divs.append( forwarded_row(bg_color, forwarded_sym, descr[0] if descr else missing_description) )
 
         mod_briefs = sym_lookup_table[imported_module.upper()]['description']
         mod_descr = mod_briefs[0] if mod_briefs else missing_description # Only the 1st \brief is retained here
@@ -921,7 +990,37 @@ def render_forwarded(forwarded, my_symbols_map, my_forwardings,
     return my_body
 
 #===============================================================================
-def get_referenced_privates(referenced_so_far, my_symbols_map, ast, rel_path):
+def render_used_by(symbols, mod_name, users):
+    """ One list for the page: each public symbol with users links to its entry."""
+
+    yes = False
+    sym_divs = []
+    for sym in symbols:
+        my_users = users.get((mod_name, sym))
+        if not my_users:
+            continue
+
+        bg_color  = '#f2f2f2' if yes else 'white'
+        yes = not yes
+        sym_name = sym.lower()
+        content = [newTag('a', content=sym_name, attributes={"href":'#'+sym_name, "class":'symname'}), ':']
+        for user in my_users:
+            user = user.lower()
+            content.append( newTag('a', content=user, attributes={"href":filename(user)}) )
+        sym_divs.append( newTag('div', content=content, newlines=False, attributes={"class":'used_by', "style":'background-color:'+bg_color}) )
+    if not sym_divs:
+        return
+
+    container = newTag('div', content=sym_divs, attributes={"class":'box'})
+    body_parts = [newTag('h4', content='Used by:'), container]
+    my_body = newTag('div', content=body_parts, id='used_by', attributes={"class":'box', "style":'border:none;'})
+    return my_body
+
+#===============================================================================
+def get_referenced_privates(referenced_so_far, my_symbols_map, ast):
+    """ The closure of the private parameters and types referenced so far: those
+        referenced by their types, in turn, until none is new. Only the types of
+        what render_parameters and render_types_set would render are walked."""
 
     referenced = referenced_so_far.copy()
     params_todo, types_todo = [], []
@@ -933,10 +1032,10 @@ def get_referenced_privates(referenced_so_far, my_symbols_map, ast, rel_path):
         # select what to process
         priv_pars = [item for item in referenced["PARAMS"] if item not in params_todo]
 
-        # dummy call only to accumulate all the referenced private parameters
-        paramts, statics, other = render_module_vars(ast['variables'], priv_pars)
+        # accumulate the private parameters and types referenced by them
+        paramts, statics, other = render_module_vars(ast['__index__']['variables'], priv_pars)
         assert(not (statics or other))
-        prvp_div = render_parameters(paramts, my_symbols_map, referenced)
+        reference_parameters(paramts, my_symbols_map, referenced)
 
         # update lists
         for item in priv_pars:
@@ -948,8 +1047,8 @@ def get_referenced_privates(referenced_so_far, my_symbols_map, ast, rel_path):
         # select what to process
         priv_types = [item for item in referenced["TYPES"] if item not in types_todo]
 
-        # dummy call only to accumulate all the referenced private parameters
-        prvt_divs = render_types_set('private', priv_types, ast['types'], my_symbols_map, referenced, rel_path)
+        # accumulate the private parameters and types referenced by their components
+        reference_types(priv_types, ast['__index__']['types'], my_symbols_map, referenced)
 
         # update lists
         for item in priv_types:
@@ -959,6 +1058,27 @@ def get_referenced_privates(referenced_so_far, my_symbols_map, ast, rel_path):
     todolists = zip(("PARAMS", "TYPES"), [params_todo, types_todo])
     return dict(todolists)
 
+#===============================================================================
+def reference_parameters(paramts, my_symbols_map, referenced_private_syms):
+    """ What render_parameters references, in the same order."""
+    for v in sorted(paramts, key=lambda v: v['name']):
+        owner_mod, ext_sym = my_symbols_map[v['name']]
+        if owner_mod in ('__HERE__', '__REFERENCED_PRIV__'):
+            reference_vartype(v['type'], my_symbols_map, referenced_private_syms)
+        else:
+            raise Exception('"%s:%s"'%my_symbols_map[v['name']])
+
+#===============================================================================
+def reference_types(names, ast, my_symbols_map, referenced_private_syms):
+    """ What render_types_set references, in the same order."""
+    for sym in sorted(names):
+        owner_mod, ext_sym = my_symbols_map[sym]
+        if owner_mod in ('__HERE__', '__REFERENCED_PRIV__'):
+            for v in ast[sym]['variables']:
+                reference_vartype(v['type'], my_symbols_map, referenced_private_syms)
+        elif owner_mod != '__PRIV__':
+            raise Exception('"%s:%s"'%my_symbols_map[sym])
+
 #===============================================================================
 def group_arguments(args):
     alists = []
@@ -1062,11 +1182,16 @@ def printout(body, prefix, mod_name=None, title=None, output_file=None, jscript=
     html = newTag('html', content=[head, body])
     if (html_class):
         html.addAttribute("class", html_class)
-    stuff = ["<!DOCTYPE html>", html.make(tab='  ')]
     f = open(filename(output_file, prefix=prefix), 'w' )
-    f.write('\n'.join(stuff))
+    write_page(html, f)
     f.close()
 
+#===============================================================================
+def write_page(html, sink):
+    """ The DOCTYPE line, then the html tag streamed into the sink (see newTag.write)."""
+    sink.write("<!DOCTYPE html>\n")
+    html.write(sink, tab='  ')
+
 #===============================================================================
 def filename(owner_module, **kwargs):
     suffix  = kwargs.pop('suffix', 'html')
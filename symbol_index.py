@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Build the SymbolIndex of an ASTs directory (or bundle) and save it, for tools
+# that only need to query it, e.g. an editor plugin:
+#   index = SymbolIndex.load(<index-file>)
+#   index.resolve('TOP_MOD', 'RENAMED') -> (('BASE_MOD', 'A_FUN'), 'functions', [...])
+
+import sys
+import cPickle as pickle
+import utils
+
+#=============================================================================
+def main():
+    if(len(sys.argv) != 3):
+        print("Usage: symbol_index.py <ASTs-dir|ASTs-bundle> <index-file>")
+        sys.exit(1)
+
+    ast_dir = sys.argv[1]
+    index_file = sys.argv[2]
+
+    from ast2doc import lookup_imported_symbols
+    sym_lookup_table = lookup_imported_symbols(ast_dir)
+    index = SymbolIndex(sym_lookup_table)
+    utils.close_symbol_table(sym_lookup_table)
+    index.save(index_file)
+    print 'Symbol index: %d symbols in %d modules saved to %s' % (len(index.resolved), len(index.modules), index_file)
+
+#=============================================================================
+def symbol_users(sym_lookup_table):
+    """ Reference where a symbol is defined -> modules importing it, through
+        forwarding modules or not, in one pass over the table; only the candidates
+        of multiple imports are looked up afterwards. All ast2doc.py needs, while
+        the whole SymbolIndex mostly duplicates the table."""
+    users, multi = {}, []
+    for mod_name in sym_lookup_table:
+        entry = sym_lookup_table[mod_name]
+        symmap = entry['symbols_map']
+        for sym in entry['umap']:
+            if not sym in symmap:
+                continue
+            ref = symmap[sym]
+            if ref[0] == '__MULTI__':
+                # the story ends here, see utils.process_forwarded
+                multi.extend( (mod_name, candidate) for candidate in ref[1] )
+            else:
+                # the maps refer to imported symbols where they are defined
+                users.setdefault(ref, set()).add(mod_name)
+
+    # the candidates, as imported by the modules that listed them
+    for mod_name, (m, s) in multi:
+        owner = (m, s)
+        if m in sym_lookup_table:
+            owner = sym_lookup_table[m]['symbols_map'].get(s, owner)
+            if owner[0] in ('__HERE__', '__PRIV__', '__REFERENCED_PRIV__'):
+                owner = utils.symbol_ref(m, s)
+        users.setdefault(owner, set()).add(mod_name)
+
+    return dict( (ref, tuple(sorted(mods))) for ref, mods in users.iteritems() )
+
+#=============================================================================
+class SymbolIndex():
+    """ The answers of the symbol lookup table, precomputed into hash indexes: every
+        query is a dictionary lookup. Names are case insensitive; symbols are referred
+        to by (module, symbol) tuples, as in the table (see utils.symbol_ref).
+        Only USE statements with an ONLY list are tracked, as in the table."""
+
+    version = 2 # 2: users
+
+    def __init__(self, sym_lookup_table):
+        self.modules = []
+        self.resolved = {}  # (module, symbol) -> (reference, category, description)
+        self.owners = {}    # symbol -> modules defining it as public
+        self.chains = {}    # (module, symbol) -> forward chain
+        self.importers = {} # (module, symbol) -> references of the local names importing it
+        self.module_importers = {} # module -> modules importing from it
+        self.users = symbol_users(sym_lookup_table) # reference where a symbol is defined -> modules importing it
+
+        for mod_name in sym_lookup_table:
+            self.modules.append(mod_name)
+            entry = sym_lookup_table[mod_name]
+            symmap, symcat, symdescr = entry['symbols_map'], entry['symbols_cat'], entry['symbols_descr']
+
+            for sym, ref in symmap.iteritems():
+                if ref[0] in ('__HERE__', '__PRIV__', '__REFERENCED_PRIV__'):
+                    ref = utils.symbol_ref(mod_name, sym)
+                self.resolved[(mod_name, sym)] = (ref, symcat.get(sym), symdescr.get(sym))
+
+            for sym in entry['my_symbols']:
+                self.owners.setdefault(sym, []).append(mod_name)
+
+            for sym, refs in entry['umap'].iteritems():
+                for ref in refs:
+                    self.importers.setdefault(ref, []).append(utils.symbol_ref(mod_name, sym))
+                    self.module_importers.setdefault(ref[0], set()).add(mod_name)
+                if sym in symmap and symmap[sym][0] != '__MULTI__':
+                    self.chains[(mod_name, sym)] = tuple(utils.forward_chain(mod_name, sym, sym_lookup_table))
+
+        # frozen, the answers are shared
+        self.modules.sort()
+        self.owners = dict( (sym, tuple(sorted(mods))) for sym, mods in self.owners.iteritems() )
+        self.importers = dict( (ref, tuple(sorted(set(refs)))) for ref, refs in self.importers.iteritems() )
+        self.module_importers = dict( (m, tuple(sorted(mods))) for m, mods in self.module_importers.iteritems() )
+
+    def resolve(self, module, symbol):
+        """ (reference of the symbol where it is really defined, its category, its
+            description), None for unknown symbols. The description is only known
+            for public symbols; a symbol imported from several modules is referred
+            to by ('__MULTI__', (reference, ...))."""
+        return self.resolved.get((module.upper(), symbol.upper()))
+
+    def owner_of(self, symbol):
+        """ The modules defining a public symbol of that name."""
+        return self.owners.get(symbol.upper(), ())
+
+    def forward_chain(self, module, symbol):
+        """ The references leading from a symbol imported by the module to where it
+            is defined, () for symbols not imported."""
+        return self.chains.get((module.upper(), symbol.upper()), ())
+
+    def importers_of(self, module, symbol=None):
+        """ The references of the local names importing the symbol of the module
+            directly, or without a symbol the modules importing from the module."""
+        if symbol is None:
+            return self.module_importers.get(module.upper(), ())
+        return self.importers.get((module.upper(), symbol.upper()), ())
+
+    def users_of(self, module, symbol):
+        """ The modules importing the symbol defined by the module, directly or
+            through forwarding modules."""
+        return self.users.get((module.upper(), symbol.upper()), ())
+
+    def save(self, index_file):
+        f = open(index_file, 'wb')
+        pickle.dump((self.version, self.__dict__), f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+
+    @classmethod
+    def load(cls, index_file):
+        f = open(index_file, 'rb')
+        version, state = pickle.load(f)
+        f.close()
+        if version != cls.version:
+            raise Exception('Symbol index "%s": version %s, expected %s' % (index_file, version, cls.version))
+        index = cls({})
+        index.__dict__.update(state)
+        return index
+
+#=============================================================================
+if __name__ == '__main__':
+    main()
+
+#EOF
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The literal-only AST loader must agree with literal_eval() on well-formed input,
+# and refuse malformed input (then parse_ast_text falls back to literal_eval()).
+# Usage: python -m unittest discover tests
+
+import sys, os, unittest
+from ast import literal_eval
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import utils
+
+#=============================================================================
+class TestParseLiterals(unittest.TestCase):
+
+    def test_well_formed(self):
+        for text in ["[1, 2]", "{1: 2, 3: 4}", "(1,)", "()", "[]", "{}", "[1, 2,]", "{1: 2,}",
+                     "((1, 2),)", "[True, False, None, -1.5e3, 10L]", "'x'", "[ 1, 2 ]\n",
+                     "{'a': [1, (2, 3)],\n 'b': 'c\\'d'}"]:
+            self.assertEqual(utils.parse_literals(text), literal_eval(text), text)
+
+    def test_malformed(self):
+        for text in ["[1 2]", "{1:2 3:4}", "{1 2}", "{1, 2}", "[1,,2]", "[,1]", "[1:2]", "{1:}", "{:1}",
+                     "(1)", "[1}", "(1, 2]", "1 2", "[1],", "[1", "['a]"]:
+            self.assertRaises(ValueError, utils.parse_literals, text)
+
+    def test_fallback(self):
+        # valid, but not as pformat writes it
+        self.assertEqual(utils.parse_ast_text("[1 , 2]"), [1, 2])
+        self.assertEqual(utils.parse_ast_text("(1)"), 1)
+        self.assertRaises(SyntaxError, utils.parse_ast_text, "[1 2]")
+
+#=============================================================================
+if __name__ == '__main__':
+    unittest.main()
+
+#EOF
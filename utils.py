@@ -2,19 +2,194 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
+import sys
+import time
+import bz2
+import gzip
+import json
+import mmap
+import struct
+import hashlib
+import sqlite3
+import tempfile
+import thread
+import threading
+import multiprocessing
+import cPickle as pickle
+from cStringIO import StringIO
+from ast import literal_eval
+from collections import OrderedDict, deque
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+try:
+    import resource
+except ImportError:
+    resource = None
 
 external_modules = ['ISO_FORTRAN_ENV', 'ISO_C_BINDING']
 external_symbols = ['MPI_COMM_SELF', 'MPI_COMM_NULL', 'MPI_COMM_WORLD']
+
+#=============================================================================
+#   S Y M B O L   R E F E R E N C E S
 #=============================================================================
-def cache_symbol_lookup(ast, ast_dir, sym_lookup_table, level=-1):
+# The lookup table refers to a symbol by a (module, symbol) tuple of interned
+# strings, the module being a module name or one of the markers '__HERE__',
+# '__PRIV__', '__REFERENCED_PRIV__' and '__EXTERNAL__'. A symbol imported from
+# several modules is referred to by ('__MULTI__', (ref, ref, ...)). Equal
+# references are one and the same tuple: the entries unpickled from the saved
+# table, the SQLite backend or the worker processes are re-interned (see
+# reintern_entry) as they enter the table.
+symbol_refs = {}
+
+def symbol_ref(module, sym):
+    key = (module, sym)
+    ref = symbol_refs.get(key)
+    if ref is None:
+        ref = symbol_refs[key] = (intern(module), intern(sym))
+    return ref
 
-    level += 1
-    my_name = ast['name']
-    if(my_name in sym_lookup_table):
-        return
-    if verbose(): print '%sCaching: "%s"' % ('  '*level, my_name)
+#=============================================================================
+def parse_ref(target):
+    """ The reference to a "module:symbol" string (as found in the ASTs)."""
+    module, sym = target.split(':',1)
+    return symbol_ref(module, sym)
+
+#=============================================================================
+def multi_ref(targets):
+    ref = ('__MULTI__', tuple(parse_ref(t) for t in targets))
+    return symbol_refs.setdefault(ref, ref)
+
+#=============================================================================
+def reintern_ref(ref):
+    if ref[0] == '__MULTI__':
+        ref = ('__MULTI__', tuple(symbol_ref(*r) for r in ref[1]))
+        return symbol_refs.setdefault(ref, ref)
+    return symbol_ref(*ref)
+
+#=============================================================================
+def reintern_entry(entry):
+    """ Share the references and names of an unpickled lookup table entry with
+        the ones of this process, in place."""
+    entry['symbols_map'] = dict( (intern(sym), reintern_ref(ref)) for sym, ref in entry['symbols_map'].iteritems() )
+    entry['symbols_cat'] = dict( (intern(sym), intern(cat)) for sym, cat in entry['symbols_cat'].iteritems() )
+    entry['symbols_descr'] = dict( (intern(sym), descr) for sym, descr in entry['symbols_descr'].iteritems() )
+    entry['umap'] = dict( (intern(sym), [symbol_ref(*r) for r in refs]) for sym, refs in entry['umap'].iteritems() )
+    entry['symbols_forwarded'] = dict( (intern(sym), [symbol_ref(*r) for r in chain])
+                                       for sym, chain in entry['symbols_forwarded'].iteritems() )
+    entry['my_symbols'] = [intern(sym) for sym in entry['my_symbols']]
+    return entry
+
+#=============================================================================
+def resolve_symbols(sources, ast_dir, sym_lookup_table, jobs=1):
+    """ Build the USE graph of the modules not resolved yet, starting from the given
+        ASTs (or AST files), then resolve them in topological order (Kahn's algorithm),
+        one dependency level at a time: the modules of a level only USE modules of the
+        previous ones, with jobs > 1 they are resolved by a pool of processes.
+        Returns the number of levels, and of those resolved by a pool."""
+
+    # the graph: name -> (AST or AST file, USEd modules still to be resolved)
+    graph = OrderedDict()
+    todo = [(None, source) for source in reversed(sources)]
+    while todo:
+        my_name, source = todo.pop()
+        if my_name in sym_lookup_table or my_name in graph:
+            continue
+        ast = load_source(source)
+        if my_name is None:
+            my_name = ast['name']
+            if my_name in sym_lookup_table or my_name in graph:
+                continue
+        assert(ast['name'] == my_name)
+        deps = [m for m in used_modules(ast) if not m in sym_lookup_table]
+        graph[my_name] = (source, deps)
+        # only the file names are retained, the store may evict the ASTs meanwhile
+        todo.extend( (m, module_ast_file(ast_dir, m)) for m in reversed(deps) if not m in graph )
+
+    # the worklist, level by level
+    waiting, users = {}, {}
+    for my_name, (source, deps) in graph.iteritems():
+        waiting[my_name] = len(deps)
+        for m in deps:
+            users.setdefault(m, []).append(my_name)
+    level = [my_name for my_name in graph if not waiting[my_name]]
+    nlevels, npooled = 0, 0
+    while level:
+        nlevels += 1
+        if pooled_level(level, jobs):
+            npooled += 1
+        for my_name, entry in resolve_level(level, graph, sym_lookup_table, jobs):
+            sym_lookup_table[my_name] = entry
+        next_level = []
+        for my_name in level:
+            for user in users.get(my_name, ()):
+                waiting[user] -= 1
+                if not waiting[user]:
+                    next_level.append(user)
+        level = next_level
+
+    cycle = [my_name for my_name in graph if waiting[my_name]]
+    if cycle:
+        raise Exception('Circular USE dependencies among modules: %s' % ', '.join(cycle))
+    return nlevels, npooled
+
+#=============================================================================
+def load_source(source):
+    return source if isinstance(source, dict) else ast_store.get(source)
+
+#=============================================================================
+resolve_jobs = int(os.getenv('AST2DOC_JOBS') or 1) # 0: as many processes as cores
+if not resolve_jobs:
+    resolve_jobs = multiprocessing.cpu_count()
+parallel_level_min = 8 # smaller levels are not worth a pool
+resolve_state = {} # the graph and the table, as inherited by the forked workers
+
+def pooled_level(level, jobs):
+    return jobs > 1 and len(level) >= parallel_level_min
+
+def resolve_level(level, graph, sym_lookup_table, jobs):
+    if not pooled_level(level, jobs):
+        return [resolve_module(my_name, graph, sym_lookup_table) for my_name in level]
+
+    if isinstance(sym_lookup_table, DiskSymbolTable):
+        sym_lookup_table.commit() # the workers read the file
+    resolve_state.update(graph=graph, table=sym_lookup_table)
+    pool = multiprocessing.Pool(jobs) # forked now, i.e. with the table as it stands
+    try:
+        results = pool.map(resolve_in_worker, level, chunksize=max(1, len(level)/(4*jobs)))
+        return [(my_name, reintern_entry(entry)) for my_name, entry in results]
+    finally:
+        pool.close()
+        pool.join()
+        resolve_state.clear()
+
+#=============================================================================
+def resolve_in_worker(my_name):
+    return resolve_module(my_name, resolve_state['graph'], resolve_state['table'])
+
+#=============================================================================
+def resolve_module(my_name, graph, sym_lookup_table):
+    if verbose(): print 'Caching: "%s"' % my_name
+    source, deps = graph[my_name]
+    return my_name, build_module_entry(load_source(source), sym_lookup_table)
+
+#=============================================================================
+def used_modules(ast):
+    """ The modules whose symbols are imported by USE statements (external ones excluded)."""
+    return [m for m in modules_symbols(ast['uses']) if not m in external_modules]
+
+#=============================================================================
+def build_module_entry(ast, sym_lookup_table):
+    """ The lookup table entry of a module (or routine) AST; the table must already
+        contain the entries of all the modules it USEs."""
 
     # init
+    my_name = ast['name']
     my_own_pubs = []
     my_sym_map = {}
     my_sym_cat = {}
@@ -23,18 +198,17 @@ def cache_symbol_lookup(ast, ast_dir, sym_lookup_table, level=-1):
     if 'publics' in ast:
         my_pubs = [p['name'] for p in ast['publics']]
         for cat in 'functions', 'subroutines', 'interfaces', 'types', 'variables':
-            names_list = [f['name'] for f in ast[cat]]
-            names = set(names_list)
+            names = set(ast['__index__'][cat])
 
             # publics
             for sym in names.intersection(my_pubs):
-                my_sym_map[sym] = ':'.join(['__HERE__', sym])
+                my_sym_map[sym] = symbol_ref('__HERE__', sym)
                 my_sym_cat[sym] = cat
                 my_own_pubs.append(sym)
 
             # private symbols as well
             for sym in names.difference(my_pubs):
-                my_sym_map[sym] = ':'.join(['__PRIV__', sym])
+                my_sym_map[sym] = symbol_ref('__PRIV__', sym)
                 my_sym_cat[sym] = cat
 
     else:
@@ -49,14 +223,10 @@ def cache_symbol_lookup(ast, ast_dir, sym_lookup_table, level=-1):
             # the AST for external modules is not available!
             for sym in imported_syms:
                 assert(sym == imported_syms[sym])
-                my_sym_map[sym] = ':'.join([module, sym])
+                my_sym_map[sym] = symbol_ref(module, sym)
 
         else:
-            if not sym_lookup_table.has_key(module):
-                module_file = os.path.join(ast_dir, module.lower()+".ast")
-                m = read_ast(module_file, do_doxycheck=False)
-                cache_symbol_lookup(m, ast_dir, sym_lookup_table, level)
-            assert(module in sym_lookup_table) # TODO redundant
+            assert(module in sym_lookup_table)
 
             imported_module_map = sym_lookup_table[module]
             next_sym_map, next_sym_cat = get_sym_map(module, imported_module_map, imported_syms)
@@ -68,8 +238,8 @@ def cache_symbol_lookup(ast, ast_dir, sym_lookup_table, level=-1):
 
     my_sym_descr = prefetch_descriptions(my_pubs, ast, sym_lookup_table, my_sym_map, my_sym_cat)
 
-    sym_lookup_table[my_name] = {
-        'description':ast['descr'],
+    return {
+        'description':raw_descr(ast),
         'symbols_map':my_sym_map,
         'symbols_cat':my_sym_cat,
         'symbols_descr':my_sym_descr,
@@ -78,6 +248,23 @@ def cache_symbol_lookup(ast, ast_dir, sym_lookup_table, level=-1):
         'my_symbols':sorted(my_own_pubs)
     }
 
+#=============================================================================
+routine_symmaps = {} # the same local USE statements give the same map
+
+def routine_symbols_map(subr, ast_dir, sym_lookup_table):
+    """ The symbols map due to the USE statements local to a routine, resolved against
+        the (global) lookup table: only the USEd modules possibly missing therein are
+        resolved, and the maps are memoized by USE statements."""
+    uses = tuple(sorted( (u['from'], tuple(sorted(u['only'].iteritems()))) for u in subr['uses'] if 'only' in u ))
+    multi = tuple(sorted( (k, tuple(v)) for k, v in subr['multiple_imports'].iteritems() ))
+    key = (id(sym_lookup_table), uses, multi)
+    if not key in routine_symmaps:
+        missing = [m for m in used_modules(subr) if not m in sym_lookup_table]
+        if missing:
+            resolve_symbols([module_ast_file(ast_dir, m) for m in missing], ast_dir, sym_lookup_table)
+        routine_symmaps[key] = build_module_entry(subr, sym_lookup_table)['symbols_map']
+    return routine_symmaps[key]
+
 #=============================================================================
 def prefetch_descriptions(my_pubs, ast, sym_lookup_table, my_sym_map, my_sym_cat):
 
@@ -87,29 +274,27 @@ def prefetch_descriptions(my_pubs, ast, sym_lookup_table, my_sym_map, my_sym_cat
     for sym in my_pubs:
         cat = my_sym_cat[sym]
         assert(sym in my_sym_map)
-        owner_module, external_symbol = my_sym_map[sym].split(':',1)
+        owner_module, external_symbol = my_sym_map[sym]
 
         if owner_module == '__HERE__':
-            sym_ast = next( (item for item in ast[cat] if item['name']==sym), None )
-            assert(sym_ast)
+            sym_ast = ast['__index__'][cat][sym]
 
             if 'descr' in sym_ast:
-                my_sym_descr[sym] = sym_ast['descr']
+                my_sym_descr[sym] = raw_descr(sym_ast)
 
             elif cat=='interfaces':
                 # try to get the interface description from its concrete procedures.
                 if sym_ast['task'] == 'overloading':
                     concrete_descrs = set()
                     for specific in sym_ast['procedures']:
-                        spec_mod, spec_sym = my_sym_map[specific].split(':')
+                        spec_mod, spec_sym = my_sym_map[specific]
                         spec_cat = my_sym_cat[specific]
                         assert(spec_cat in ('functions', 'subroutines'))
 
                         if (spec_mod in ('__HERE__', '__PRIV__')):
-                            f = next( (item for item in ast[spec_cat] if item['name']==specific), None )
-                            assert(f)
+                            f = ast['__index__'][spec_cat][specific]
                             if f['descr']:
-                                concrete_descrs.add(f['descr'][0])
+                                concrete_descrs.add(raw_descr(f)[0])
 
                         else:
                             descr = sym_lookup_table[spec_mod]['symbols_descr'][spec_sym]
@@ -127,8 +312,7 @@ def prefetch_descriptions(my_pubs, ast, sym_lookup_table, my_sym_map, my_sym_cat
         elif owner_module == '__MULTI__':
             assert(cat=='interfaces')
             concrete_descrs = set()
-            for specific in eval(external_symbol):
-                spec_mod, spec_sym = specific.split(':')
+            for spec_mod, spec_sym in external_symbol:
                 assert(sym_lookup_table[spec_mod]['symbols_cat'][spec_sym]=='interfaces')
                 descr = sym_lookup_table[spec_mod]['symbols_descr'][spec_sym]
                 if descr:
@@ -149,13 +333,13 @@ def get_sym_map(mod_name, mod_map, syms):
         sym_therein = syms[sym]
         if sym_therein in external_symbols:
             assert(sym_therein == sym)
-            out_map[sym] = ':'.join(['__EXTERNAL__', sym])
+            out_map[sym] = symbol_ref('__EXTERNAL__', sym)
         else:
             assert(sym_therein in mod_sym_map)
-            m, s = mod_sym_map[sym_therein].split(':',1)
-            if m == '__HERE__':  # __PRIV__ symbols cannot be reached via USE statements...
-                m = mod_name
-            out_map[sym] = ':'.join([m, s])
+            ref = mod_sym_map[sym_therein]
+            if ref[0] == '__HERE__':  # __PRIV__ symbols cannot be reached via USE statements...
+                ref = symbol_ref(mod_name, ref[1])
+            out_map[sym] = ref
             out_cat[sym] = mod_map['symbols_cat'][sym_therein]
 
     return out_map, out_cat
@@ -165,9 +349,10 @@ def update_symmap_inplace(sym_cat, sym_map, next_sym_map, next_sym_cat, multiple
     for k, v in next_sym_map.iteritems():
         sym_cat[k] = next_sym_cat[k]
         if k in multiple_imports:
-            assert(v in multiple_imports[k] and next_sym_cat[k] in ('interfaces', 'variables'))
+            multi = multi_ref(multiple_imports[k])
+            assert(v in multi[1] and next_sym_cat[k] in ('interfaces', 'variables'))
             if not k in sym_map:
-                sym_map[k] = "__MULTI__:%r" % multiple_imports[k]
+                sym_map[k] = multi
         else:
             sym_map[k] = v
 
@@ -182,13 +367,15 @@ def process_forwarded(mod_name, pubnames, umap, symmap, sym_lookup_table):
             if(not sym in symmap):
                 raise Exception('MOD: "%s", SYM: "%s"'%(mod_name, sym))
 
-            assert(isinstance(symmap[sym], basestring))
-            m, s = symmap[sym].split(':',1)
+            assert(isinstance(symmap[sym], tuple))
+            m, s = symmap[sym]
             if m == '__MULTI__':
-                # The story ends here! (s is a string!)
-                assert sorted(umap[sym])==sorted(eval(s))
+                # The story ends here! (s is a tuple of references!)
+                assert sorted(umap[sym])==sorted(s)
             elif m != '__HERE__':
                 chain = trace_symbol(sym, umap, symmap, sym_lookup_table)
+                forward_chains[(mod_name, sym)] = chain
+                forward_chains_stats['misses'] += 1
                 assert(chain[-1] == symmap[sym])
                 if len(chain)>1:
                     # store the trace only when there are more than one step!
@@ -203,13 +390,34 @@ def trace_symbol(sym, umap, symmap, sym_lookup_table):
     for usym in umap[sym]:
         chain = [usym]
         if usym != symmap[sym]:
-            used_module, sym_therein = usym.split(':',1)
-            next_umap   = sym_lookup_table[used_module]['umap']
-            next_symmap = sym_lookup_table[used_module]['symbols_map']
-            chain.extend( trace_symbol(sym_therein, next_umap, next_symmap, sym_lookup_table) )
+            used_module, sym_therein = usym
+            chain.extend( forward_chain(used_module, sym_therein, sym_lookup_table) )
 
     return chain
 
+#=============================================================================
+forward_chains = {} # (module, symbol) -> its chain, for the lookup table of the run
+forward_chains_stats = {'hits':0, 'misses':0}
+
+def forward_chain(module, sym, sym_lookup_table):
+    """ The steps (references) leading from a symbol forwarded by a module
+        (already in the table) to its original location, see trace_symbol. Memoized."""
+    key = (module, sym)
+    chain = forward_chains.get(key)
+    if chain is None:
+        entry = sym_lookup_table[module]
+        chain = forward_chains[key] = trace_symbol(sym, entry['umap'], entry['symbols_map'], sym_lookup_table)
+        forward_chains_stats['misses'] += 1
+    else:
+        forward_chains_stats['hits'] += 1
+    return chain
+
+#=============================================================================
+def print_forward_chains_stats():
+    hits, misses = forward_chains_stats['hits'], forward_chains_stats['misses']
+    print 'Forward chains: %d traced, %d reused (hit rate %.1f%%)' % (
+        misses, hits, 100.0*hits/(hits+misses) if hits+misses else 0.0)
+
 #=============================================================================
 def modules_symbols(uses):
     """ Convert the 'uses' ast key content (a list of dictionaries)
@@ -228,7 +436,7 @@ def modules_symbols(uses):
 def reverse_sym_map(symbols_map):
     mmap = {}
     for s in symbols_map:
-        module, external_sym = symbols_map[s].split(':')
+        module, external_sym = symbols_map[s]
         mmap.setdefault(module, {}).update({s:external_sym})
     return mmap
 
@@ -237,110 +445,1064 @@ def map_symbol_to_module(uses, multiple_imports):
     """ Convert the 'uses' ast key content (a list of dictionaries)
         to a dictionary with:
         - keys: internal symbol name
-        - values: strings of the form "owner_module:external_symbol_name"."""
+        - values: lists of references (owner_module, external_symbol_name)."""
     d = {}
     for u in uses:
         module = u['from']
         if('only' in u):
             symbols = u['only']
-            d.update( dict(zip(symbols.keys(), [[':'.join([module, external_sym])] for external_sym in symbols.values()])) )
-    d.update(multiple_imports)
+            d.update( dict(zip(symbols.keys(), [[symbol_ref(module, external_sym)] for external_sym in symbols.values()])) )
+    d.update( (k, [parse_ref(t) for t in targets]) for k, targets in multiple_imports.iteritems() )
     return(d)
 
 #===============================================================================
-def read_ast(fn_in, wanted=None, category=None, do_doxycheck=True):
-    assert(fn_in.endswith(".ast"))
-    f = open(fn_in,'ro')
-    content = f.read()
-    ast = eval(content)
-    f.close()
-
-    if(do_doxycheck):
-        check_html_in_doxydescr(ast)
+def read_ast(fn_in, wanted=None, category=None):
+    """ Read a whole AST or, when a category is given, only that section of it
+        (or even only the wanted symbol therein): the rest of the file is not decoded.
+        Whatever is returned is already normalized (see normalize_ast)."""
+    assert(split_ast_suffix(fn_in)[1])
 
     if(wanted):
         # only extract a symbol, but we need to know the category...
         assert(category)
-        s = next( (item for item in ast[category] if item['name']==wanted), None )
-        assert(s)
-        return s
 
-    else:
-        return ast
+    if(category):
+        return read_ast_section(fn_in, category, wanted)
+    return load_cached_ast(fn_in)
 
 #===============================================================================
-def check_html_in_doxydescr(ast):
-    for d in traverse_ast(ast, key='descr'):
-        descr = d['descr']
-        if descr:
-            fixed_descr = html_checker(descr)
-            if(fixed_descr != descr):
-               #print '"%r" "%r"' % (descr, fixed_descr)
-                d['descr'] = fixed_descr
+def read_ast_section(fn_in, category, wanted=None):
+    index = load_cached_index(fn_in)
+    assert(category in index)
+    beg, end, items = index[category]
+    if(wanted):
+        assert(wanted in items)
+        beg, end = items[wanted]
+    section = parse_ast_text(read_ast_text(fn_in, beg, end))
+    check_html_in_doxydescr(section)
+    for node in ([section] if wanted else section):
+        normalize_symbol(category, node)
+    return section
 
 #===============================================================================
-def html_checker(input_html):
+#   N O R M A L I Z E D   A S T   (the IR consumed by the renderers)
+#===============================================================================
+# Done once, when an AST is loaded (and cached together with it), in place of the
+# re-derivations the renderers used to do on every access:
+#  - descriptions already went through the html checker (the lookup table keeps
+#    them as written, see raw_descr);
+#  - every named node carries its lowercase name ('lname');
+#  - routine arguments carry their 'intent', 'dim', 'attrs_str' and 'name+dim'
+#    (INTENT and DIMENSION are popped from 'attrs') and the description of their
+#    group, if any;
+#  - modules carry the set of their public names ('__publics__') and, for each
+#    category, a name -> node index ('__index__'; as list.index(), the first
+#    node with a given name wins).
+symbol_categories = ('functions', 'subroutines', 'interfaces', 'types', 'variables')
+
+def normalize_ast(ast):
+    check_html_in_doxydescr(ast)
+    ast['lname'] = ast['name'].lower()
+    if 'publics' in ast:
+        ast['__publics__'] = set(p['name'] for p in ast['publics'])
+    ast['__index__'] = {}
+    for cat in symbol_categories:
+        if cat in ast:
+            index = ast['__index__'][cat] = {}
+            for node in ast[cat]:
+                normalize_symbol(cat, node)
+                index.setdefault(node['name'], node)
+    return ast
 
-    if(isinstance(input_html, list)):
-        fixed_html = []
-        for line in input_html:
-            fixed_html.append(html_checker(line))
-        return fixed_html
+#===============================================================================
+def normalize_symbol(cat, node):
+    node['lname'] = node['name'].lower()
+    if cat in ('functions', 'subroutines'):
+        normalize_routine(node)
+    elif cat == 'interfaces':
+        if node['task'] in ('abstract_interface', 'explicit_interface'):
+            for proc in node['procedures']:
+                normalize_routine(proc)
+    elif cat == 'types':
+        for v in node['variables']:
+            v['lname'] = v['name'].lower()
 
+#===============================================================================
+def normalize_routine(subr):
+    subr['lname'] = subr['name'].lower()
+    args = subr['args']
+    if subr['retval']:
+        subr['retval']['lname'] = subr['retval']['name'].lower()
+
+    if '__grouped_args_descr__' in subr:
+        arg_names = [a['name'] for a in args]
+        for group in subr['__grouped_args_descr__']:
+            for aname in group['grouped_args']:
+                # just copy the description into all the arguments of this group
+                a = args[arg_names.index(aname)]
+                assert(not a['descr'])
+                a['descr'] = group['descr']
+                if '__raw_descr__' in group:
+                    a['__raw_descr__'] = group['__raw_descr__']
+
+    for arg in args:
+        arg['lname'] = arg['name'].lower()
+        attrs = arg['attrs']
+        intent = next((a for a in attrs if a.startswith("INTENT(")), "")
+        if(intent):
+            attrs.remove(intent)
+            intent = re.match("INTENT\((.+)\)$",intent).group(1)
+        arg['intent'] = intent
+        dim = next((a for a in attrs if a.startswith("DIMENSION(")), "")
+        if(dim):
+            attrs.remove(dim)
+            if(not arg['dim']):
+                arg['dim'] = re.match("DIMENSION(\(.+\))$",dim).group(1)
+        arg['attrs_str'] = ':'.join(sorted(attrs))
+        arg['name+dim'] = arg['name'] + arg['dim']
+
+#===============================================================================
+#   A S T   F I L E S   (plain or compressed)
+#===============================================================================
+ast_suffixes = ('.ast', '.ast.gz', '.ast.bz2', '.ast.xz') # by order of preference
+ast_dir_listings = {}
+
+def split_ast_suffix(fn):
+    for suffix in ast_suffixes:
+        if fn.endswith(suffix):
+            return fn[:-len(suffix)], suffix
+    return fn, None
+
+#===============================================================================
+def ast_dir_listing(ast_dir):
+    """ Map each module name to the AST file documenting it, listing the directory only once."""
+    if not ast_dir in ast_dir_listings:
+        listing = OrderedDict()
+        bundle = get_ast_bundle(ast_dir)
+        for fn in (bundle.index.keys() if bundle else os.listdir(ast_dir)):
+            mod_name, suffix = split_ast_suffix(fn)
+            if suffix:
+                if mod_name in listing:
+                    other_suffix = split_ast_suffix(listing[mod_name])[1]
+                    if ast_suffixes.index(other_suffix) < ast_suffixes.index(suffix):
+                        continue
+                listing[mod_name] = os.path.join(ast_dir, fn)
+        ast_dir_listings[ast_dir] = listing
+    return ast_dir_listings[ast_dir]
+
+#===============================================================================
+def list_ast_files(ast_dir):
+    return ast_dir_listing(ast_dir).values()
+
+#===============================================================================
+def module_ast_file(ast_dir, mod_name):
+    my_name = mod_name.lower()
+    listing = ast_dir_listing(ast_dir)
+    if my_name in listing:
+        return listing[my_name]
+    return os.path.join(ast_dir, my_name + ".ast")
+
+#===============================================================================
+def ast_file_exists(fn_in):
+    bundle, member = find_bundle_member(fn_in)
+    if bundle:
+        return member in bundle.index
+    return os.path.isfile(fn_in)
+
+#===============================================================================
+def ast_file_stat(fn_in):
+    """ Size and mtime of an AST file; bundle members inherit the mtime of the bundle."""
+    bundle, member = find_bundle_member(fn_in)
+    if bundle:
+        offset, length = bundle.index[member]
+        return length, bundle.mtime
+    st = os.stat(fn_in)
+    return st.st_size, st.st_mtime
+
+#===============================================================================
+def read_ast_bytes(fn_in):
+    bundle, member = find_bundle_member(fn_in)
+    if bundle:
+        return bundle.read(member)
+    f = open(fn_in,'rb')
+    raw = f.read()
+    f.close()
+    return raw
+
+#===============================================================================
+def read_ast_text(fn_in, beg, end):
+    """ Random access to the text of an AST file (compressed files are decompressed first)."""
+    if split_ast_suffix(fn_in)[1] != '.ast':
+        return decompress_ast(fn_in, read_ast_bytes(fn_in))[beg:end]
+    bundle, member = find_bundle_member(fn_in)
+    if bundle:
+        offset, length = bundle.index[member]
+        return bundle.mm[offset+beg:offset+end]
+    f = open(fn_in,'rb')
+    f.seek(beg)
+    text = f.read(end-beg)
+    f.close()
+    return text
+
+#===============================================================================
+def decompress_ast(fn_in, raw):
+    suffix = split_ast_suffix(fn_in)[1]
+    if suffix == '.ast':
+        return raw
+    elif suffix == '.ast.gz':
+        return gzip.GzipFile(fileobj=StringIO(raw)).read()
+    elif suffix == '.ast.bz2':
+        return bz2.decompress(raw)
+    elif suffix == '.ast.xz':
+        if lzma is None:
+            raise Exception('Reading "%s" requires the lzma module (backports.lzma on python 2)' % fn_in)
+        return lzma.decompress(raw)
     else:
-        assert(isinstance(input_html, basestring))
-        parser = MyHTMLParser()
-        line = input_html + ' '
-        try:
-            parser.feed(line)
-        except HTMLParseError:
-            row, col = parser.getpos()
-            assert(row==1)
-            if verbose():
-                print 'Error starting at: %s{%c}%s' %(line[:col], line[col], line[col+1:])
+        assert(False) # Unknown AST suffix
 
-        if not parser.errors:
-            return input_html
+#===============================================================================
+#   A S T   B U N D L E S
+#===============================================================================
+# A bundle packs a whole AST directory into a single file: a magic string, the
+# offset of the index (8 bytes, big endian), the AST files one after the other
+# (compressed ones are kept as they are) and finally the index, a JSON object
+# mapping every file name to its [offset, length] within the bundle.
+# Members are addressed by a virtual path, i.e. <bundle-file>/<file-name>.
+bundle_magic = 'AST2DOC-BUNDLE-1'
+ast_bundles = {}
+
+class ASTBundle():
+
+    def __init__(self, fn):
+        f = open(fn, 'rb')
+        self.mtime = os.fstat(f.fileno()).st_mtime
+        self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        beg = len(bundle_magic)
+        assert(self.mm[:beg] == bundle_magic)
+        index_offset, = struct.unpack('>Q', self.mm[beg:beg+8])
+        index = json.loads(self.mm[index_offset:])
+        self.index = OrderedDict( (str(k), tuple(index[k])) for k in sorted(index) )
+
+    def read(self, member):
+        offset, length = self.index[member]
+        return self.mm[offset:offset+length]
 
-        for error, row, col in reversed(parser.errors):
-            assert(row==1)
-            if verbose():
-                print 'Error %d starting at: %s{%c}%s' %(error, line[:col], line[col], line[col+1:])
-
-            # handle error cases
-            if error==1:
-                assert(False)
-                # Some tag closing missing... No attempt to fix it, a warning is issued...
-                fixed_line = line
-            elif error==2 or error==3:
-                # an ampersand that must be escaped
-                fixed_line = line[:col] + '&amp;' + line[col+1:]
+#===============================================================================
+def is_ast_bundle(fn):
+    if not os.path.isfile(fn):
+        return False
+    f = open(fn, 'rb')
+    magic = f.read(len(bundle_magic))
+    f.close()
+    return magic == bundle_magic
+
+#===============================================================================
+def get_ast_bundle(fn):
+    """ The (memory mapped) bundle stored in fn, None if fn is not a bundle."""
+    fn = os.path.abspath(fn)
+    if not fn in ast_bundles:
+        ast_bundles[fn] = ASTBundle(fn) if is_ast_bundle(fn) else None
+    return ast_bundles[fn]
+
+#===============================================================================
+def find_bundle_member(fn_in):
+    container, member = os.path.split(fn_in)
+    return get_ast_bundle(container), member
+
+#===============================================================================
+def write_ast_bundle(ast_dir, bundle_fn):
+    tmp_fn = '%s.%d.tmp' % (bundle_fn, os.getpid())
+    f = open(tmp_fn, 'wb')
+    f.write(bundle_magic)
+    f.write(struct.pack('>Q', 0)) # the index offset is patched below
+    index = {}
+    for fn in list_ast_files(ast_dir):
+        raw = read_ast_bytes(fn)
+        index[os.path.basename(fn)] = [f.tell(), len(raw)]
+        f.write(raw)
+    index_offset = f.tell()
+    f.write(json.dumps(index, sort_keys=True))
+    f.seek(len(bundle_magic))
+    f.write(struct.pack('>Q', index_offset))
+    f.close()
+    os.rename(tmp_fn, bundle_fn)
+    return len(index)
+
+#===============================================================================
+#   A S T   S T O R E
+#===============================================================================
+class ASTStore():
+    """ Process-wide owner of the parsed ASTs: every phase borrows its ASTs from here,
+        so that each file is parsed at most once per run. The ASTs are shared and
+        already normalized (see normalize_ast): callers must not modify them.
+        Eviction: entries are retained until clear() is called, unless a maximum
+        number of entries is given ($AST2DOC_STORE_SIZE), in which case the least
+        recently used ones are dropped and re-read on demand."""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self.asts = OrderedDict()
+        self.evicted = set()
+        self.symbols = {} # single symbols decoded without reading the whole AST
+        self.stats = {'reads':0, 'partial':0, 'avoided':0, 'rereads':0}
+
+    def get(self, fn_in):
+        key = os.path.abspath(fn_in)
+        ast = self.asts.pop(key, None)
+        if ast is None:
+            return self.put(fn_in, read_ast(fn_in))
+        self.stats['avoided'] += 1
+        self.asts[key] = ast # reinserted as the most recently used one
+        return ast
+
+    def put(self, fn_in, ast):
+        """ Take over an AST read elsewhere (see ASTPrefetcher), unless a copy of it
+            is already at hand."""
+        key = os.path.abspath(fn_in)
+        if key in self.asts:
+            return self.get(fn_in)
+        self.stats['reads'] += 1
+        if key in self.evicted:
+            self.stats['rereads'] += 1
+            self.evicted.discard(key)
+        self.asts[key] = ast
+
+        if self.max_entries:
+            while len(self.asts) > self.max_entries:
+                old_key, old_ast = self.asts.popitem(last=False)
+                self.evicted.add(old_key)
+        return ast
+
+    def resident(self, fn_in):
+        return os.path.abspath(fn_in) in self.asts
+
+    def get_symbol(self, fn_in, category, wanted):
+        """ A single symbol of an AST: taken from the whole AST when this is at hand,
+            otherwise decoded on its own (see read_ast) and kept for later requests."""
+        key = os.path.abspath(fn_in)
+        if key in self.asts:
+            ast = self.get(fn_in)
+            return ast['__index__'][category][wanted]
+
+        sym_key = (key, category, wanted)
+        if sym_key in self.symbols:
+            self.stats['avoided'] += 1
+        else:
+            self.symbols[sym_key] = read_ast(fn_in, wanted, category)
+            self.stats['partial'] += 1
+        return self.symbols[sym_key]
+
+    def clear(self):
+        self.symbols.clear()
+        self.asts.clear()
+        self.evicted.clear()
+
+    def print_stats(self):
+        print 'AST store: %d files read, %d single symbols read, %d redundant reads avoided, %d re-reads after eviction' % (
+            self.stats['reads'], self.stats['partial'], self.stats['avoided'], self.stats['rereads'])
+
+ast_store = ASTStore(max_entries=int(os.getenv('AST2DOC_STORE_SIZE') or 0))
+
+#===============================================================================
+#   A S T   P R E F E T C H E R
+#===============================================================================
+class ASTPrefetcher():
+    """ Iterate over (file, AST) pairs, in the given order, while background threads
+        read and parse the ASTs coming next. At most 'depth' ASTs are read ahead of
+        the one in use; ASTs already held by the store are not read again.
+        Only the consumer touches the store: the threads merely hand over what they
+        read, the store takes it over when the consumer gets there (see ASTStore.put)."""
+
+    def __init__(self, store, files, depth):
+        self.store = store
+        self.files = list(files)
+        self.depth = depth
+        self.slots = threading.Semaphore(depth)
+        self.lock = threading.Lock()
+        self.todo = deque(enumerate(self.files))
+        self.done = [threading.Event() for fn in self.files]
+        self.results = [None for fn in self.files] # (ast, exc_info)
+        self.stats = {'read_ahead':0, 'stalls':0, 'stall_time':0.0}
+
+    def __iter__(self):
+        if self.depth:
+            for i in range(min(self.depth, len(self.files))):
+                t = threading.Thread(target=self.worker)
+                t.daemon = True
+                t.start()
+
+        for i, fn in enumerate(self.files):
+            if not self.depth:
+                yield fn, self.store.get(fn)
+                continue
+
+            if not self.done[i].is_set():
+                self.stats['stalls'] += 1
+                t0 = time.time()
+                self.done[i].wait()
+                self.stats['stall_time'] += time.time() - t0
+
+            ast, exc_info = self.results[i]
+            self.results[i] = None
+            if exc_info:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if ast is None:
+                yield fn, self.store.get(fn)
+            else:
+                self.slots.release()
+                yield fn, self.store.put(fn, ast)
+
+    def worker(self):
+        while True:
+            self.slots.acquire()
+            with self.lock:
+                if not self.todo:
+                    self.slots.release()
+                    return
+                i, fn = self.todo.popleft()
+
+            ast, exc_info = None, None
+            if self.store.resident(fn):
+                self.slots.release() # nothing to hold on to
             else:
-                assert(False) # Unknown error code
+                try:
+                    ast = read_ast(fn)
+                    with self.lock:
+                        self.stats['read_ahead'] += 1
+                except Exception:
+                    exc_info = sys.exc_info()
+            self.results[i] = (ast, exc_info)
+            self.done[i].set()
 
-            line = fixed_line
+    def print_stats(self):
+        print 'AST prefetch: %d ASTs read ahead (depth %d), stalled %d times waiting for input, %.2fs overall' % (
+            self.stats['read_ahead'], self.depth, self.stats['stalls'], self.stats['stall_time'])
 
-        return line.strip()
+prefetch_depth = int(os.getenv('AST2DOC_PREFETCH', '2') or 0) # 0 disables the read-ahead
 
 #===============================================================================
-def traverse_ast(o, key, tree_types=(list, tuple)):
+#   P A R S E D - A S T   C A C H E
+#===============================================================================
+ast_cache_version = 4 # 2: the normalized IR is cached, not the raw AST; 3: name indexes; 4: raw descriptions
+ast_cache_stats = {'ast':{'hits':0, 'misses':0}, 'index':{'hits':0, 'misses':0}}
+
+def ast_cache_dir(fn_in):
+    """ The cache lives in $AST2DOC_CACHE_DIR when set (an empty value disables it),
+        otherwise in a '.cache' sibling of the directory hosting the AST file."""
+    return ast_dir_cache_dir(os.path.dirname(os.path.abspath(fn_in)))
 
-    if not o:
+#===============================================================================
+def ast_dir_cache_dir(ast_dir):
+    cache_dir = os.getenv('AST2DOC_CACHE_DIR')
+    if cache_dir is None:
+        cache_dir = os.path.abspath(ast_dir) + '.cache'
+    return cache_dir
+
+#===============================================================================
+def load_cached_ast(fn_in):
+    """ Return the normalized content of an AST file, skipping the parsing when an
+        up-to-date copy is found in the cache."""
+    return load_cached(fn_in, 'ast', lambda content: normalize_ast(parse_ast_text(content)))
+
+#===============================================================================
+def load_cached_index(fn_in):
+    """ Return the sections index of an AST file (see index_ast_text)."""
+    return load_cached(fn_in, 'index', index_ast_text)
+
+#===============================================================================
+def load_cached(fn_in, kind, compute):
+    """ Return compute(<text of the AST file>), reusing the cached result when possible.
+        Entries are keyed by the absolute path of the AST file and validated against
+        its size, mtime and content hash."""
+
+    fn_abs = os.path.abspath(fn_in)
+    size, mtime = ast_file_stat(fn_abs)
+    cache_dir = ast_cache_dir(fn_abs)
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, '%s.%s.pickle' % (hashlib.sha1(fn_abs).hexdigest(), kind))
+    stats = ast_cache_stats[kind]
+
+    # fast path: size and mtime unchanged
+    header = read_cache_header(cache_file) if cache_file else None
+    if header and header['size'] == size and header['mtime'] == mtime:
+        result = read_cache_body(cache_file)
+        if result is not None:
+            stats['hits'] += 1
+            return result
+
+    raw = read_ast_bytes(fn_abs)
+    digest = hashlib.sha1(raw).hexdigest()
+
+    # slow path: the file has been touched, but its content may be the same
+    if header and header['sha1'] == digest:
+        result = read_cache_body(cache_file)
+        if result is not None:
+            stats['hits'] += 1
+            write_cache_entry(cache_file, fn_abs, size, mtime, digest, result)
+            return result
+
+    stats['misses'] += 1
+    result = compute(decompress_ast(fn_abs, raw))
+    if cache_file:
+        write_cache_entry(cache_file, fn_abs, size, mtime, digest, result)
+    return result
+
+#===============================================================================
+def read_cache_header(cache_file):
+    try:
+        f = open(cache_file, 'rb')
+    except IOError:
+        return None
+    try:
+        header = pickle.load(f)
+    except Exception:
+        header = None
+    f.close()
+    if header and header.get('version') == ast_cache_version:
+        return header
+
+#===============================================================================
+def read_cache_body(cache_file):
+    try:
+        f = open(cache_file, 'rb')
+        pickle.load(f) # header
+        result = pickle.load(f)
+        f.close()
+    except Exception:
+        return None
+    return result
+
+#===============================================================================
+def write_cache_entry(cache_file, fn_abs, size, mtime, digest, result):
+    header = {'version':ast_cache_version, 'path':fn_abs, 'size':size, 'mtime':mtime, 'sha1':digest}
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # write aside and rename, so that concurrent runs never see a partial entry
+        tmp_file = '%s.%d.%d.tmp' % (cache_file, os.getpid(), thread.get_ident())
+        f = open(tmp_file, 'wb')
+        pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        if verbose():
+            print 'Warning: cannot write the AST cache entry "%s": %s' % (cache_file, e)
+
+#===============================================================================
+#   P E R S I S T E N T   S Y M B O L   L O O K U P   T A B L E
+#===============================================================================
+# The lookup table built by resolve_symbols() is saved in the cache directory,
+# together with, for each AST file, its fingerprint (size, mtime, sha1), the name
+# of the table entry it produced and the modules it USEs. At the next run, the
+# entries of the changed (or removed) files are dropped along with those of the
+# modules depending on them, transitively: only these have to be recomputed.
+symtab_cache_version = 2 # 2: references are tuples
+
+def symtab_cache_file(ast_dir, ext='pickle'):
+    cache_dir = ast_dir_cache_dir(ast_dir)
+    if cache_dir:
+        ast_dir = os.path.abspath(ast_dir)
+        return os.path.join(cache_dir, 'symtab.%s.%s' % (hashlib.sha1(ast_dir).hexdigest(), ext))
+
+#===============================================================================
+def load_symbol_table(ast_dir, files):
+    """ Return the still valid part of the saved lookup table, and the records of
+        the AST files it comes from."""
+    if symtab_backend == 'sqlite':
+        return open_disk_symbol_table(ast_dir, files)
+    if symtab_backend != 'memory':
+        raise Exception('Unknown symbol table backend "%s" (memory or sqlite)' % symtab_backend)
+
+    snapshot = None
+    cache_file = symtab_cache_file(ast_dir)
+    if cache_file and os.path.isfile(cache_file):
+        try:
+            f = open(cache_file, 'rb')
+            snapshot = pickle.load(f)
+            f.close()
+        except Exception:
+            snapshot = None
+    if not snapshot or snapshot['version'] != (symtab_cache_version, ast_cache_version):
+        return {}, {}
+
+    records, stale = valid_records(snapshot['files'], files)
+    table = dict( (intern(k), reintern_entry(v)) for k, v in snapshot['table'].iteritems() if not k in stale )
+    return table, records
+
+#===============================================================================
+def valid_records(old_records, files):
+    """ The records still valid, and the names of the stale entries: the ones
+        produced by changed or removed files, and those of the modules depending
+        on them, transitively."""
+    records, stale = {}, set()
+    for fn in files:
+        if fn in old_records:
+            old = old_records[fn]
+            fingerprint = file_fingerprint(fn, old['fingerprint'])
+            if fingerprint[2] == old['fingerprint'][2]:
+                records[fn] = dict(old, fingerprint=fingerprint)
+            else:
+                stale.add(old['name'])
+    for fn in set(old_records).difference(files):
+        stale.add(old_records[fn]['name'])
+
+    users = {}
+    for r in old_records.itervalues():
+        for used_module in r['uses']:
+            users.setdefault(used_module, set()).add(r['name'])
+    todo = list(stale)
+    while todo:
+        for user in users.get(todo.pop(), ()):
+            if not user in stale:
+                stale.add(user)
+                todo.append(user)
+
+    records = dict( (fn, r) for fn, r in records.iteritems() if not r['name'] in stale )
+    return records, stale
+
+#===============================================================================
+def symbol_table_record(fn_in, ast):
+    uses = set(u['from'] for u in ast['uses'] if 'only' in u)
+    return {'fingerprint':file_fingerprint(fn_in), 'name':ast['name'], 'uses':sorted(uses.difference(external_modules))}
+
+#===============================================================================
+def save_symbol_table(ast_dir, table, records):
+    if isinstance(table, DiskSymbolTable):
+        table.save(records, (symtab_cache_version, ast_cache_version))
         return
-    elif isinstance(o, dict):
-        if key in o:
-            yield o
-        next_iterable = o.itervalues()
-    elif isinstance(o, tree_types):
-        next_iterable = o
-    elif isinstance(o, (bool, basestring)):
+    cache_file = symtab_cache_file(ast_dir)
+    if not cache_file:
         return
-    else:
-        raise Exception(type(o))
+    snapshot = {'version':(symtab_cache_version, ast_cache_version), 'table':table, 'files':records}
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+        f = open(tmp_file, 'wb')
+        pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        if verbose():
+            print 'Warning: cannot save the symbol lookup table "%s": %s' % (cache_file, e)
+
+#===============================================================================
+#   S Y M B O L   T A B L E   B A C K E N D S
+#===============================================================================
+# The lookup table is a dict by default ($AST2DOC_SYMTAB_BACKEND=memory). With
+# $AST2DOC_SYMTAB_BACKEND=sqlite it is kept in a SQLite file instead, only the
+# $AST2DOC_SYMTAB_HOT most recently used entries staying in memory. The file is
+# the persistent table itself when a cache directory is available, otherwise a
+# temporary one. Resolution and rendering only rely on lookup, insertion,
+# membership, len() and iteration over the names, which both provide.
+symtab_backend = os.getenv('AST2DOC_SYMTAB_BACKEND') or 'memory'
+symtab_hot_size = int(os.getenv('AST2DOC_SYMTAB_HOT') or 128)
+
+class DiskSymbolTable():
+    """ Dict-like lookup table whose entries are pickled in a SQLite file. The entries
+        changed in place while in memory (the rendering marks the referenced private
+        symbols) are written back when evicted; a change made through a reference
+        kept after the eviction is not seen by later lookups.
+        Only save() commits: close() drops whatever was written after it, so that
+        the file holds the table as resolved, like the pickled one.
+        The table can be used by forked processes, each one opening its own
+        connection; they must not modify it."""
+
+    def __init__(self, db_file, hot_size, temporary=False):
+        self.db_file = db_file
+        self.temporary = temporary
+        self.hot_size = max(1, hot_size)
+        self.hot = OrderedDict() # name -> entry, the least recently used first
+        self.digests = {}        # name -> digest of the stored pickle
+        self.owner = os.getpid()
+        self.pid, self.db, self.inherited = None, None, []
+        self.stats = {'hits':0, 'loads':0, 'evictions':0, 'writebacks':0}
+
+        db = self.connection()
+        db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB)')
+        db.execute('CREATE TABLE IF NOT EXISTS entries (name TEXT PRIMARY KEY, entry BLOB)')
+        db.execute('CREATE TABLE IF NOT EXISTS files (fn TEXT PRIMARY KEY, record BLOB)')
+        db.commit()
+        self.names = set(name for (name,) in db.execute('SELECT name FROM entries'))
+
+    def connection(self):
+        if self.pid != os.getpid():
+            # a forked process must not use the connection of its parent (nor close it)
+            if self.db is not None:
+                self.inherited.append(self.db)
+            self.db = sqlite3.connect(self.db_file, timeout=60)
+            self.db.text_factory = str
+            self.pid = os.getpid()
+        return self.db
+
+    def __getitem__(self, name):
+        entry = self.hot.pop(name, None)
+        if entry is None:
+            row = self.connection().execute('SELECT entry FROM entries WHERE name=?', (name,)).fetchone()
+            if row is None:
+                raise KeyError(name)
+            blob = str(row[0])
+            entry = reintern_entry(pickle.loads(blob))
+            self.digests[name] = hashlib.md5(blob).digest()
+            self.stats['loads'] += 1
+        else:
+            self.stats['hits'] += 1
+        self.hot[name] = entry # (re)inserted as the most recently used one
+        self.evict()
+        return entry
+
+    def __setitem__(self, name, entry):
+        self.hot.pop(name, None)
+        self.store(name, pickle.dumps(entry, pickle.HIGHEST_PROTOCOL))
+        self.names.add(name)
+        self.hot[name] = entry
+        self.evict()
+
+    def __delitem__(self, name):
+        if not name in self.names:
+            raise KeyError(name)
+        self.connection().execute('DELETE FROM entries WHERE name=?', (name,))
+        self.names.discard(name)
+        self.hot.pop(name, None)
+        self.digests.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(sorted(self.names))
+
+    def keys(self):
+        return sorted(self.names)
+
+    def get(self, name, default=None):
+        return self[name] if name in self.names else default
+
+    def store(self, name, blob):
+        self.connection().execute('INSERT OR REPLACE INTO entries VALUES (?, ?)', (name, buffer(blob)))
+        self.digests[name] = hashlib.md5(blob).digest()
+
+    def write_back(self, name, entry):
+        if os.getpid() != self.owner:
+            return
+        blob = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        if hashlib.md5(blob).digest() == self.digests.get(name):
+            return
+        # pickling an unpickled entry does not give the same bytes back, compare the contents
+        row = self.connection().execute('SELECT entry FROM entries WHERE name=?', (name,)).fetchone()
+        if row is None or pickle.loads(str(row[0])) != entry:
+            self.store(name, blob)
+            self.stats['writebacks'] += 1
+
+    def evict(self):
+        while len(self.hot) > self.hot_size:
+            name, entry = self.hot.popitem(last=False)
+            self.stats['evictions'] += 1
+            self.write_back(name, entry)
+
+    def commit(self):
+        """ Make the entries inserted so far visible to processes forked next."""
+        self.connection().commit()
+
+    def saved_records(self, version):
+        db = self.connection()
+        row = db.execute('SELECT value FROM meta WHERE key=?', ('version',)).fetchone()
+        if row is None or str(row[0]) != repr(version):
+            return {}
+        return dict( (fn, pickle.loads(str(blob))) for fn, blob in db.execute('SELECT fn, record FROM files') )
+
+    def save(self, records, version):
+        for name, entry in self.hot.iteritems():
+            self.write_back(name, entry)
+        db = self.connection()
+        db.execute('DELETE FROM files')
+        db.executemany('INSERT INTO files VALUES (?, ?)',
+            ((fn, buffer(pickle.dumps(r, pickle.HIGHEST_PROTOCOL))) for fn, r in records.iteritems()))
+        db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('version', repr(version)))
+        db.commit()
+
+    def close(self):
+        if self.db is None:
+            return
+        self.db.rollback()
+        self.db.close()
+        self.db, self.pid = None, None
+        self.hot.clear()
+        if self.temporary and os.path.exists(self.db_file):
+            os.remove(self.db_file)
+
+    def print_stats(self):
+        print 'Symbol table (sqlite, %d hot entries): %d hits, %d loads, %d evictions, %d written back' % (
+            self.hot_size, self.stats['hits'], self.stats['loads'], self.stats['evictions'], self.stats['writebacks'])
+
+#===============================================================================
+def open_disk_symbol_table(ast_dir, files):
+    """ The DiskSymbolTable counterpart of load_symbol_table."""
+    db_file = symtab_cache_file(ast_dir, 'sqlite')
+    temporary = not db_file
+    if temporary:
+        fd, db_file = tempfile.mkstemp(prefix='ast2doc-symtab.', suffix='.sqlite')
+        os.close(fd)
+    elif not os.path.isdir(os.path.dirname(db_file)):
+        os.makedirs(os.path.dirname(db_file))
+    table = DiskSymbolTable(db_file, symtab_hot_size, temporary)
+
+    records, stale = valid_records(table.saved_records((symtab_cache_version, ast_cache_version)), files)
+    # entries left behind by an interrupted run have no record either
+    valid = set(r['name'] for r in records.itervalues())
+    for name in [n for n in table if not n in valid]:
+        del table[name]
+    return table, records
+
+#===============================================================================
+def close_symbol_table(table):
+    if isinstance(table, DiskSymbolTable):
+        table.close()
+
+#===============================================================================
+def print_symbol_table_stats(table):
+    if isinstance(table, DiskSymbolTable):
+        table.print_stats()
+
+#===============================================================================
+def print_peak_rss():
+    if resource is None:
+        return
+    # kilobytes on Linux, bytes on macOS
+    scale = 1.0 if sys.platform == 'darwin' else 1024.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale/2**20
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss*scale/2**20
+    print 'Peak RSS: %.1f MB (symbol table backend: %s, largest child process: %.1f MB)' % (
+        peak, symtab_backend, children)
+
+#===============================================================================
+def file_fingerprint(fn_in, old=None):
+    """ (size, mtime, sha1) of an AST file; the hash is not recomputed as long as
+        size and mtime match the old fingerprint."""
+    size, mtime = ast_file_stat(fn_in)
+    if old and old[:2] == (size, mtime):
+        return old
+    return size, mtime, hashlib.sha1(read_ast_bytes(fn_in)).hexdigest()
+
+#===============================================================================
+#   L I T E R A L - O N L Y   A S T   L O A D E R
+#===============================================================================
+# fparse dumps its ASTs via repr()/pformat(): only dicts, lists, tuples, strings,
+# numbers, booleans and None can show up. The tokens are assembled on a stack,
+# each with the separator (',' or ':') right in front of it, which must be the
+# one expected there: anything else raises ValueError, i.e. falls back to
+# literal_eval() (as does whitespace before a separator, never written by pformat).
+ast_token = r"""[\[\]{}()]|'[^'\\\n]*(?:\\.[^'\\\n]*)*'|"[^"\\\n]*(?:\\.[^"\\\n]*)*"|[^\s\[\]{}(),:'"]+"""
+ast_token_re = re.compile(r"""[\s,:]*(%s)""" % ast_token) # separators skipped, for index_ast_text
+ast_sep_token_re = re.compile(r"""([,:]?)\s*(%s|[,:'"])""" % ast_token) # a stray separator or quote is a token
+ast_constants = {'True':True, 'False':False, 'None':None}
+ast_closing = {']':'[', '}':'{', ')':'('}
+
+def parse_ast_text(content):
+    """ Parse the text of an AST file without eval(). Anything outside the plain
+        literal format is handed over to ast.literal_eval(), which is safe but slow."""
+    try:
+        return parse_literals(content)
+    except ValueError:
+        if verbose():
+            print 'Warning: falling back to literal_eval()'
+        return literal_eval(content)
+
+#===============================================================================
+def parse_literals(content):
+    stack = []
+    items = root = []
+    kind = None      # the opening char of the container being filled
+    expected = ''    # the separator in front of the next value, None when none may come
+    shared = {}.setdefault # identical strings (mostly dict keys) are stored only once
+    for sep, tok in ast_sep_token_re.findall(content):
+        c = tok[0]
+        if c == ']' or c == '}' or c == ')':
+            # a trailing ',' is allowed after a value (a key-value pair)
+            if kind != ast_closing[c] or (sep and sep != expected):
+                raise ValueError('Misplaced "%s%s"' % (sep, c))
+            if c == ']':
+                value = items
+            elif c == '}':
+                if len(items) % 2:
+                    raise ValueError('Malformed dictionary')
+                it = iter(items)
+                value = dict(zip(it, it))
+            else:
+                if len(items) == 1 and not sep:
+                    raise ValueError('Not a tuple') # (x) is x
+                value = tuple(items)
+            items, kind, expected = stack.pop()
+            items.append(value)
+
+        elif sep != expected:
+            raise ValueError('Expected "%s" before "%s"' % (expected, tok))
+
+        elif c == "'" or c == '"':
+            if len(tok) < 2:
+                raise ValueError('Unterminated string')
+            if '\\' in tok:
+                items.append(tok[1:-1].decode('string_escape'))
+            else:
+                s = tok[1:-1]
+                items.append(shared(s, s))
+        elif c == '[' or c == '{' or c == '(':
+            stack.append((items, kind, expected))
+            items, kind, expected = [], c, ''
+            continue
+        elif tok in ast_constants:
+            items.append(ast_constants[tok])
+        else:
+            items.append(parse_number(tok)) # raises ValueError on a stray separator
+
+        # after a value
+        if kind == '{':
+            expected = ',' if expected == ':' else ':'
+        elif kind:
+            expected = ','
+        else:
+            expected = None
+
+    if stack or len(root) != 1 or content.rstrip()[-1:] in (',', ':'):
+        raise ValueError('Not a single literal')
+    return root[0]
+
+#===============================================================================
+def parse_number(tok):
+    try:
+        if tok[-1] in 'lL':
+            return long(tok[:-1])
+        return int(tok)
+    except ValueError:
+        return float(tok) # raises ValueError on anything else
+
+#===============================================================================
+def index_ast_text(content):
+    """ Locate the sections (i.e. the top level keys) of an AST text and, within each
+        section, its named items. Returns {section: (beg, end, {name: (beg, end)})},
+        the offsets allow to decode a section or a single symbol on its own."""
+    sections = {}
+    stack = [] # open containers: [opening char, beg, items so far, last key, name, named items]
+    for m in ast_token_re.finditer(content):
+        tok = m.group(1)
+        c = tok[0]
+        if c == '[' or c == '{' or c == '(':
+            stack.append([c, m.start(1), 0, None, None, OrderedDict()])
+            continue
+        elif c == ']' or c == '}' or c == ')':
+            closed = stack.pop()
+            beg, end = closed[1], m.end(1)
+        else:
+            closed = None
+            beg, end = m.start(1), m.end(1)
+
+        if not stack:
+            break # that was the whole AST
+        parent = stack[-1]
+        depth = len(stack)
+        if parent[0] == '{' and parent[2] % 2 == 0:
+            parent[3] = tok[1:-1] # a key
+        elif parent[0] == '{':
+            key = parent[3]
+            if depth == 1:
+                sections[key] = (beg, end, closed[5] if closed else {})
+            elif depth == 3 and key == 'name' and not closed:
+                parent[4] = parse_literals(tok)
+        elif depth == 2 and closed and closed[4]:
+            parent[5].setdefault(closed[4], (beg, end)) # as next(), the first one wins
+        parent[2] += 1
+
+    return sections
+
+#===============================================================================
+def print_ast_cache_stats():
+    print 'AST cache: %d hits, %d misses (sections indexes: %d hits, %d misses)' % (
+        ast_cache_stats['ast']['hits'], ast_cache_stats['ast']['misses'],
+        ast_cache_stats['index']['hits'], ast_cache_stats['index']['misses'])
+
+#===============================================================================
+def check_html_in_doxydescr(ast):
+    """ Fix the descriptions in place; the ones changed keep their original text
+        in '__raw_descr__'."""
+    todo = [ast]
+    while todo:
+        o = todo.pop()
+        if isinstance(o, dict):
+            descr = o.get('descr')
+            if descr:
+                fixed_descr = html_checker(descr)
+                if(fixed_descr != descr):
+                   #print '"%r" "%r"' % (descr, fixed_descr)
+                    o['descr'] = fixed_descr
+                    o['__raw_descr__'] = descr
+            todo.extend(o.itervalues())
+        elif isinstance(o, (list, tuple)):
+            todo.extend(o)
+
+#===============================================================================
+def raw_descr(node):
+    """ The description of a node as written in the AST, before the html checker."""
+    return node.get('__raw_descr__', node.get('descr'))
+
+#===============================================================================
+html_checked = {} # memo of the lines that needed the parser
+
+def html_checker(input_html):
+
+    if(isinstance(input_html, list)):
+        return [html_checker(line) for line in input_html]
+
+    assert(isinstance(input_html, basestring))
+    if not ('&' in input_html or '<' in input_html):
+        return input_html # nothing to fix without markup characters
+
+    fixed_html = html_checked.get(input_html)
+    if fixed_html is None:
+        fixed_html = html_checked[input_html] = parse_html_line(input_html)
+    return fixed_html
+
+#===============================================================================
+def parse_html_line(input_html):
+    parser = MyHTMLParser()
+    line = input_html + ' '
+    try:
+        parser.feed(line)
+    except HTMLParseError:
+        row, col = parser.getpos()
+        assert(row==1)
+        if verbose():
+            print 'Error starting at: %s{%c}%s' %(line[:col], line[col], line[col+1:])
+
+    if not parser.errors:
+        return input_html
+
+    for error, row, col in reversed(parser.errors):
+        assert(row==1)
+        if verbose():
+            print 'Error %d starting at: %s{%c}%s' %(error, line[:col], line[col], line[col+1:])
+
+        # handle error cases
+        if error==1:
+            assert(False)
+            # Some tag closing missing... No attempt to fix it, a warning is issued...
+            fixed_line = line
+        elif error==2 or error==3:
+            # an ampersand that must be escaped
+            fixed_line = line[:col] + '&amp;' + line[col+1:]
+        else:
+            assert(False) # Unknown error code
+
+        line = fixed_line
 
-    for value in next_iterable:
-        for d in traverse_ast(value, key, tree_types):
-            yield d
+    return line.strip()
 
 #===============================================================================
 def traverse(o, tree_types=(list, tuple)):